@@ -0,0 +1 @@
+"""Benchmarks for the unipi_neuron integration."""
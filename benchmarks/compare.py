@@ -0,0 +1,92 @@
+"""Compare two benchmark result files.
+
+Usage: python -m benchmarks.compare baseline.json candidate.json [--threshold 10]
+
+Exits with status 1 when a metric regressed by more than threshold percent.
+"""
+import argparse
+import json
+import sys
+
+# metric -> True when a higher value is better
+METRICS = {
+    "input_latency_ms.p50": False,
+    "input_latency_ms.p99": False,
+    "updates_per_sec_per_device": True,
+    "command_rtt_ms.p50": False,
+    "command_rtt_ms.p99": False,
+    "command_rtt_storm_ms.p50": False,
+    "command_rtt_storm_ms.p99": False,
+    "scene_ms": False,
+    "reflex_latency_ms.p50": False,
+    "reflex_latency_ms.p99": False,
+    "cover_stop_ms.p50": False,
+    "cover_stop_ms.p99": False,
+    "cover_run_error_ms.p50": False,
+    "cover_run_error_ms.p99": False,
+    "direct_switch_apply_ms": False,
+    "memory_bytes_per_entity": False,
+    "idle_cpu_percent": False,
+    "cpu_seconds": False,
+    "stall_detection_s": False,
+}
+
+
+def metric(result, name):
+    value = result
+    for key in name.split("."):
+        if value is None:
+            return None
+        value = value.get(key)
+    return value
+
+
+def scenario_key(result):
+    # Results from before the transport option are websocket results
+    return (
+        result["devices"],
+        result["circuits_per_device"],
+        result.get("transport", "websocket"),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10, help="allowed regression in percent")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.candidate) as file:
+        candidate = json.load(file)
+
+    scenarios = {
+        scenario_key(result): result
+        for result in baseline["results"]
+    }
+    print(f"{baseline['integration_version']} -> {candidate['integration_version']}")
+    regressed = False
+    for result in candidate["results"]:
+        scenario = scenario_key(result)
+        base = scenarios.get(scenario)
+        if base is None:
+            continue
+        print(f"{scenario[0]} device(s) x {scenario[1]} circuits over {scenario[2]}")
+        for name, higher_is_better in METRICS.items():
+            old, new = metric(base, name), metric(result, name)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > args.threshold:
+                flag = "  REGRESSION"
+                regressed = True
+            print(f"  {name:32} {old:12.3f} {new:12.3f} {change:+7.1f}%{flag}")
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""Stand-in EVOK websocket server for benchmarks."""
+import asyncio
+import json
+import logging
+
+import websockets
+
+_LOGGER = logging.getLogger(__name__)
+
+# Devices an input in DirectSwitch mode can switch
+DIRECT_SWITCH_OUTPUTS = ("relay", "ro", "do")
+
+
+class FakeEvokServer:
+    """Serve the subset of the EVOK websocket API the integration uses.
+
+    Supports the "filter", "all" and "set" commands. Changed circuits are
+    pushed to every client whose filter includes the device, like EVOK
+    does for real I/O changes. Inputs in DirectSwitch mode switch the
+    output with the same circuit name, like the Neuron firmware. A set
+    with a timeout switches the output back when it expires.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self._host = host
+        self._port = port
+        self._server = None
+        self._clients = {}
+        self._stalled = []
+        # (dev, circuit) -> EVOK device section
+        self.circuits = {}
+        self.received = 0
+        # (dev, circuit) -> handle of a running set timeout
+        self._timeouts = {}
+
+    @property
+    def address(self):
+        """Return the address to configure as ip_address."""
+        return f"{self._host}:{self._port}"
+
+    def add_circuit(self, dev, circuit, value=0, **extra):
+        """Add a circuit to the simulated device."""
+        self.circuits[(dev, circuit)] = {
+            "dev": dev,
+            "circuit": circuit,
+            "value": value,
+            **extra,
+        }
+
+    async def start(self):
+        self._server = await websockets.serve(self._handler, self._host, self._port)
+        self._port = next(iter(self._server.sockets)).getsockname()[1]
+
+    async def stop(self):
+        for websocket in self._stalled:
+            websocket.transport.abort()
+        for websocket in list(self._clients):
+            await websocket.close()
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def inject(self, dev, circuit, value):
+        """Change a circuit as if its physical input changed."""
+        await self._update(dev, circuit, {"value": value})
+
+    async def disconnect_clients(self):
+        """Drop every client connection."""
+        for websocket in list(self._clients):
+            await websocket.close()
+
+    def stall_clients(self):
+        """Stop reading from every client, like a half-open connection."""
+        for websocket in list(self._clients):
+            websocket.transport.pause_reading()
+            self._stalled.append(websocket)
+            del self._clients[websocket]
+
+    async def _handler(self, websocket, path=None):
+        self._clients[websocket] = set()
+        try:
+            async for message in websocket:
+                self.received += 1
+                await self._on_message(websocket, json.loads(message))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            self._clients.pop(websocket, None)
+
+    async def _on_message(self, websocket, message):
+        cmd = message.get("cmd")
+        if cmd == "filter":
+            devices = message.get("devices", [])
+            if isinstance(devices, str):
+                devices = [devices]
+            self._clients[websocket] = set(devices)
+        elif cmd == "all":
+            sections = [{"dev": "neuron", "circuit": "1", "model": "L203"}]
+            sections.extend(self.circuits.values())
+            await websocket.send(json.dumps(sections))
+        elif cmd == "set":
+            # Like EVOK, only "value" is passed to the device; a dict holds
+            # the keyword arguments of its set()
+            value = message.get("value")
+            if isinstance(value, dict):
+                fields = dict(value)
+            elif value is not None:
+                fields = {"value": value}
+            else:
+                fields = {}
+            key = (message["dev"], str(message["circuit"]))
+            # Like EVOK, a new set cancels a running timeout
+            handle = self._timeouts.pop(key, None)
+            if handle is not None:
+                handle.cancel()
+            timeout = fields.pop("timeout", None)
+            await self._update(*key, fields)
+            if timeout is not None and key in self.circuits:
+                value = 1 - self.circuits[key]["value"]
+                self._timeouts[key] = asyncio.get_running_loop().call_later(
+                    float(timeout), self._expire, key, value
+                )
+        else:
+            _LOGGER.debug("Ignoring unsupported command %s", message)
+
+    def _expire(self, key, value):
+        del self._timeouts[key]
+        asyncio.get_running_loop().create_task(self._update(*key, {"value": value}))
+
+    async def _update(self, dev, circuit, fields):
+        section = self.circuits.get((dev, circuit))
+        if section is None:
+            return
+        changed = False
+        for key, value in fields.items():
+            if isinstance(value, str):
+                value = _number(value)
+            if section.get(key) != value:
+                section[key] = value
+                changed = True
+        if not changed:
+            return
+        frame = json.dumps([section])
+        sends = [
+            websocket.send(frame)
+            for websocket, devices in self._clients.items()
+            if dev in devices
+        ]
+        if sends:
+            await asyncio.gather(*sends, return_exceptions=True)
+        if "value" in fields and section.get("mode") == "DirectSwitch":
+            await self._direct_switch(circuit, section["value"], section.get("ds_mode"))
+
+    async def _direct_switch(self, circuit, value, ds_mode):
+        for dev in DIRECT_SWITCH_OUTPUTS:
+            output = self.circuits.get((dev, circuit))
+            if output is None:
+                continue
+            if ds_mode == "Inverted":
+                value = 1 - value
+            elif ds_mode == "Toggle":
+                if not value:
+                    return
+                value = 1 - output["value"]
+            await self._update(dev, circuit, {"value": value})
+            return
+
+
+def _number(value):
+    """Convert a numeric string to the number EVOK would report."""
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
@@ -0,0 +1,95 @@
+"""Stand-in Neuron Modbus TCP server for benchmarks."""
+import asyncio
+import logging
+import struct
+
+_LOGGER = logging.getLogger(__name__)
+
+ILLEGAL_FUNCTION = 1
+
+
+class FakeModbusServer:
+    """Serve the circuits of a FakeEvokServer as Neuron holding registers.
+
+    Supports reading holding registers (3) with the bitmap layout of the
+    integration's registers config, and writing single (5) and multiple
+    (15) coils of the blocks with a coil. Written outputs are changed on
+    the EVOK server, so both transports see the same device.
+    """
+
+    def __init__(self, evok, registers, host="127.0.0.1", port=0):
+        self._evok = evok
+        self._host = host
+        self._port = port
+        self._server = None
+        # register -> [(dev, circuit, bit)]
+        self.bits = {}
+        # coil -> (dev, circuit)
+        self.coils = {}
+        for block in registers:
+            for index in range(block["count"]):
+                register = block["register"] + index // 16
+                circuit = f"{block['group']}_{index + 1:02d}"
+                self.bits.setdefault(register, []).append((block["device"], circuit, index % 16))
+                if "coil" in block:
+                    self.coils[block["coil"] + index] = (block["device"], circuit)
+        self.requests = 0
+
+    @property
+    def port(self):
+        return self._port
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handler, self._host, self._port)
+        self._port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def read_register(self, register):
+        value = 0
+        for dev, circuit, bit in self.bits.get(register, ()):
+            section = self._evok.circuits.get((dev, circuit))
+            if section is not None and section["value"] == 1:
+                value |= 1 << bit
+        return value
+
+    async def _write_coil(self, coil, value):
+        if coil in self.coils:
+            await self._evok.inject(*self.coils[coil], int(value))
+
+    async def _handler(self, reader, writer):
+        try:
+            while True:
+                header = await reader.readexactly(7)
+                transaction, protocol, length, unit = struct.unpack(">HHHB", header)
+                pdu = await reader.readexactly(length - 1)
+                self.requests += 1
+                response = await self._on_request(pdu)
+                writer.write(
+                    struct.pack(">HHHB", transaction, protocol, len(response) + 1, unit) + response
+                )
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _on_request(self, pdu):
+        function = pdu[0]
+        if function == 3:
+            address, count = struct.unpack(">HH", pdu[1:5])
+            values = [self.read_register(address + offset) for offset in range(count)]
+            return struct.pack(f">BB{count}H", function, 2 * count, *values)
+        if function == 5:
+            address, value = struct.unpack(">HH", pdu[1:5])
+            await self._write_coil(address, value == 0xFF00)
+            return pdu[:5]
+        if function == 15:
+            address, count = struct.unpack(">HH", pdu[1:5])
+            packed = pdu[6:]
+            for offset in range(count):
+                await self._write_coil(address + offset, packed[offset // 8] >> offset % 8 & 1)
+            return struct.pack(">BHH", function, address, count)
+        _LOGGER.debug("Ignoring unsupported function %s", function)
+        return struct.pack(">BB", function | 0x80, ILLEGAL_FUNCTION)
@@ -0,0 +1,281 @@
+"""Minimal Home Assistant harness running the integration against fake EVOK servers."""
+import asyncio
+from datetime import timedelta
+import logging
+import os
+import tempfile
+
+from homeassistant import config_entries, loader
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import (
+    area_registry as ar,
+    device_registry as dr,
+    entity,
+    entity_registry as er,
+    issue_registry as ir,
+    template,
+)
+from homeassistant.helpers.entity_platform import EntityPlatform
+from homeassistant.helpers.storage import Store
+from homeassistant.setup import async_setup_component
+
+from .fake_evok import FakeEvokServer
+from .fake_modbus import FakeModbusServer
+
+_LOGGER = logging.getLogger(__name__)
+
+MODBUS_SCAN_INTERVAL = 0.02
+# Short heartbeat, so the stall detection scenario is quick
+HEARTBEAT_INTERVAL = 0.2
+
+DOMAIN = "unipi_neuron"
+# Input of every device that a reflex follows with the relay of the next device
+REFLEX_PORT = "15_01"
+# Input with a DirectSwitch rule, which the device does not have configured yet
+DIRECT_SWITCH_PORT = "15_02"
+# Position the covers are restored at, so they can be moved to a position
+COVER_POSITION = 50
+COVER_RUN_TIME = 40
+CUSTOM_COMPONENTS = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "custom_components"
+)
+
+
+async def async_create_hass():
+    """Return a started HomeAssistant instance that loads this repository."""
+    config_dir = tempfile.mkdtemp(prefix="unipi_bench_")
+    os.symlink(CUSTOM_COMPONENTS, os.path.join(config_dir, "custom_components"))
+    hass = HomeAssistant(config_dir)
+    hass.config.skip_pip = True
+    loader.async_setup(hass)
+    entity.async_setup(hass)
+    template.async_setup(hass)
+    await asyncio.gather(
+        ar.async_load(hass),
+        dr.async_load(hass),
+        er.async_load(hass),
+        ir.async_load(hass),
+    )
+    hass.config_entries = config_entries.ConfigEntries(hass, {})
+    await hass.config_entries.async_initialize()
+    await hass.async_start()
+    return hass
+
+
+def modbus_registers(circuits):
+    """Return a Modbus registers config covering {device: [circuit names]}.
+
+    Output blocks get the coils 16 * register onwards.
+    """
+    registers = []
+    register = 0
+    for device, names in circuits.items():
+        groups = {}
+        for name in names:
+            group = int(name.split("_")[0])
+            groups[group] = groups.get(group, 0) + 1
+        for group, count in groups.items():
+            block = {"device": device, "group": group, "register": register, "count": count}
+            if device != "input":
+                block["coil"] = 16 * register
+            registers.append(block)
+            register += (count + 15) // 16
+    return registers
+
+
+def circuit_names(count):
+    """Return count EVOK circuit names in the "group_index" format."""
+    return [f"{index // 99 + 1}_{index % 99 + 1:02d}" for index in range(count)]
+
+
+class BenchmarkDevice:
+    """One fake Neuron with its configured entities."""
+
+    def __init__(self, name, circuits, transport="websocket"):
+        self.name = name
+        self.server = FakeEvokServer()
+        self.transport = transport
+        self.modbus = None
+        inputs = circuits // 2
+        outputs = circuits - inputs
+        # Two outputs per cover, one cover per ten outputs
+        covers = outputs // 10
+        self.inputs = circuit_names(inputs)
+        relays = circuit_names(outputs)
+        self.cover_ports = [
+            (relays[2 * index], relays[2 * index + 1]) for index in range(covers)
+        ]
+        self.lights = relays[2 * covers:]
+        for circuit in self.inputs:
+            self.server.add_circuit("input", circuit, mode="Simple", ds_mode="Simple")
+        for circuit in relays:
+            self.server.add_circuit("relay", circuit)
+        self.server.add_circuit("input", REFLEX_PORT)
+        self.server.add_circuit("relay", REFLEX_PORT)
+        self.reflex_target = name
+        self.server.add_circuit("input", DIRECT_SWITCH_PORT, mode="Simple", ds_mode="Simple")
+        self.server.add_circuit("relay", DIRECT_SWITCH_PORT)
+        if transport == "modbus":
+            self.registers = modbus_registers(
+                {"input": self.inputs + [REFLEX_PORT], "relay": relays + [REFLEX_PORT]}
+            )
+            self.modbus = FakeModbusServer(self.server, self.registers)
+
+    def device_config(self):
+        """Return the unipi_neuron config of this device."""
+        config = {
+            "name": self.name,
+            "ip_address": self.server.address,
+            "type": "L203",
+            "heartbeat_interval": HEARTBEAT_INTERVAL,
+        }
+        config["reflexes"] = [
+            {
+                "name": "bench",
+                "port": REFLEX_PORT,
+                "action": "follow",
+                "target_device_id": self.reflex_target,
+                "target_port": REFLEX_PORT,
+            }
+        ]
+        if self.modbus is None:
+            # Through Modbus a new DirectSwitch configuration is only seen
+            # with the next full state sync
+            config["direct_switch"] = [
+                {"input": DIRECT_SWITCH_PORT, "output": DIRECT_SWITCH_PORT, "action": "toggle"}
+            ]
+        if self.transport == "command":
+            config["command_connection"] = True
+        if self.transport == "io_thread":
+            config["io_thread"] = True
+        if self.modbus is not None:
+            config["modbus"] = {
+                "port": self.modbus.port,
+                "scan_interval": MODBUS_SCAN_INTERVAL,
+                "registers": self.registers,
+            }
+        return config
+
+    def platform_configs(self):
+        """Return the light, binary_sensor and cover platform configs."""
+        lights = {
+            "device_id": self.name,
+            "devices": [
+                {"name": f"{self.name} light {port}", "device": "relay", "port": port, "mode": "on_off",
+                 "optimistic": False}
+                for port in self.lights
+            ],
+        }
+        sensors = {
+            "device_id": self.name,
+            "devices": [
+                {"name": f"{self.name} input {port}", "device": "input", "port": port,
+                 "debounce": timedelta(0), "debounce_mode": "trailing"}
+                for port in self.inputs
+            ],
+        }
+        covers = {
+            "device_id": self.name,
+            "covers": {
+                f"cover_{up}": {
+                    "name": f"cover_{up}",
+                    "device": "relay",
+                    "port_up": up,
+                    "port_down": down,
+                    "full_close_time": timedelta(seconds=COVER_RUN_TIME),
+                    "full_open_time": timedelta(seconds=COVER_RUN_TIME),
+                    "tilt_change_time": timedelta(seconds=1.5),
+                    "min_reverse_dir_time": timedelta(seconds=1),
+                    "friendly_name": f"{self.name} cover {up}",
+                }
+                for up, down in self.cover_ports
+            },
+        }
+        return {"light": lights, "binary_sensor": sensors, "cover": covers}
+
+
+class Benchmark:
+    """Home Assistant with the integration connected to fake Neurons.
+
+    Platforms are set up directly through EntityPlatform, bypassing YAML
+    validation, so scenarios can use more circuits than a real Neuron has.
+    """
+
+    def __init__(self, devices, circuits, transport="websocket"):
+        self.devices = [
+            BenchmarkDevice(f"bench{index}", circuits, transport) for index in range(devices)
+        ]
+        # Reflexes cross to the next device where there is one
+        for device, target in zip(self.devices, self.devices[1:] + self.devices[:1]):
+            device.reflex_target = target.name
+        self.hass = None
+        self.platforms = {}
+
+    @property
+    def entities(self):
+        """Return all entities of the integration."""
+        return [
+            entity
+            for platforms in self.platforms.values()
+            for platform in platforms
+            for entity in platform.entities.values()
+        ]
+
+    async def async_start(self):
+        for device in self.devices:
+            await device.server.start()
+            if device.modbus is not None:
+                await device.modbus.start()
+        self.hass = await async_create_hass()
+        await self.async_save_cover_positions()
+        config = {DOMAIN: [device.device_config() for device in self.devices]}
+        assert await async_setup_component(self.hass, DOMAIN, config)
+        await self.async_wait_ready()
+
+    async def async_save_cover_positions(self):
+        """Store COVER_POSITION as the estimate of every cover, as after a restart."""
+        restored = {
+            f"relay_{up}_at_{device.name}": {"position": COVER_POSITION, "tilt": 100}
+            for device in self.devices
+            for up, _ in device.cover_ports
+        }
+        await Store(self.hass, 1, f"{DOMAIN}.restore").async_save(restored)
+
+    async def async_wait_ready(self, timeout=60):
+        """Wait until every hub has synchronized its state."""
+        hubs = self.hass.data[DOMAIN]
+        await asyncio.wait_for(
+            asyncio.gather(*(hubs[device.name].ready.wait() for device in self.devices)),
+            timeout,
+        )
+
+    async def async_add_entities(self):
+        """Set up all platforms of all devices and wait for the entities."""
+        integration = await loader.async_get_integration(self.hass, DOMAIN)
+        for domain in ("light", "binary_sensor", "cover"):
+            assert await async_setup_component(self.hass, domain, {})
+        for device in self.devices:
+            for domain, platform_config in device.platform_configs().items():
+                if domain == "cover" and not platform_config["covers"]:
+                    continue
+                module = integration.get_platform(domain)
+                platform = EntityPlatform(
+                    hass=self.hass,
+                    logger=_LOGGER,
+                    domain=domain,
+                    platform_name=DOMAIN,
+                    platform=module,
+                    scan_interval=timedelta(seconds=30),
+                    entity_namespace=None,
+                )
+                await platform.async_setup(platform_config)
+                self.platforms.setdefault(domain, []).append(platform)
+        await self.hass.async_block_till_done()
+
+    async def async_stop(self):
+        if self.hass is not None:
+            await self.hass.async_stop(force=True)
+        for device in self.devices:
+            await device.server.stop()
+            if device.modbus is not None:
+                await device.modbus.stop()
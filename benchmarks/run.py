@@ -0,0 +1,390 @@
+"""Run the unipi_neuron benchmark suite.
+
+Usage: python -m benchmarks.run [--circuits 10,100,1000] [--devices 1,5,20]
+       [--transport websocket,command,modbus,io_thread] [--output results.json]
+
+Transport "command" is the websocket with a separate command connection.
+Transport "io_thread" is the websocket served by the I/O worker thread.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+from homeassistant.const import EVENT_STATE_CHANGED
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.entity_component import async_update_entity
+
+from .harness import (
+    COVER_RUN_TIME,
+    CUSTOM_COMPONENTS,
+    DIRECT_SWITCH_PORT,
+    DOMAIN,
+    REFLEX_PORT,
+    Benchmark,
+)
+
+LATENCY_SAMPLES = 200
+BURST_ROUNDS = 5
+COMMAND_SAMPLES = 100
+IDLE_SECONDS = 2
+COVER_SAMPLES = 10
+# Percent a cover is moved per sample
+COVER_STEP = 1
+
+
+def percentiles(samples):
+    """Summarize samples given in seconds as milliseconds."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    return {
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "max": ordered[-1] * 1000,
+        "mean": statistics.fmean(ordered) * 1000,
+    }
+
+
+class StateWaiter:
+    """Resolve futures when entities report an expected state."""
+
+    def __init__(self, hass):
+        self._waiting = {}
+        hass.bus.async_listen(EVENT_STATE_CHANGED, self._state_changed)
+
+    def expect(self, entity_id, state):
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[(entity_id, state)] = future
+        return future
+
+    def _state_changed(self, event):
+        new_state = event.data["new_state"]
+        if new_state is None:
+            return
+        future = self._waiting.pop((new_state.entity_id, new_state.state), None)
+        if future is not None and not future.done():
+            future.set_result(time.perf_counter())
+
+
+async def measure_input_latency(bench, waiter):
+    """Time from a fake input change to the binary sensor state change."""
+    sensors = [
+        (device, entity)
+        for device, entity_platform in zip(bench.devices, bench.platforms["binary_sensor"])
+        for entity in entity_platform.entities.values()
+    ]
+    samples = []
+    for index in range(min(LATENCY_SAMPLES, 2 * len(sensors))):
+        device, entity = sensors[index % len(sensors)]
+        new_value = 0 if entity.is_on else 1
+        done = waiter.expect(entity.entity_id, "on" if new_value else "off")
+        start = time.perf_counter()
+        await device.server.inject("input", entity._port, new_value)
+        samples.append(await asyncio.wait_for(done, 10) - start)
+    return percentiles(samples)
+
+
+async def measure_throughput(bench, waiter):
+    """Sustained input updates per second and device, all devices at once."""
+    total = 0
+    start = time.perf_counter()
+    for _ in range(BURST_ROUNDS):
+        pending = []
+        for device, entity_platform in zip(bench.devices, bench.platforms["binary_sensor"]):
+            for entity in entity_platform.entities.values():
+                new_value = 0 if entity.is_on else 1
+                pending.append(waiter.expect(entity.entity_id, "on" if new_value else "off"))
+                await device.server.inject("input", entity._port, new_value)
+        await asyncio.wait_for(asyncio.gather(*pending), 60)
+        total += len(pending)
+    elapsed = time.perf_counter() - start
+    return total / elapsed / len(bench.devices)
+
+
+async def measure_command_rtt(bench):
+    """Round trip of light commands until EVOK confirmed them."""
+    lights = [
+        entity
+        for entity_platform in bench.platforms["light"]
+        for entity in entity_platform.entities.values()
+    ]
+    samples = []
+    for index in range(min(COMMAND_SAMPLES, 2 * len(lights))):
+        light = lights[index % len(lights)]
+        start = time.perf_counter()
+        if light.is_on:
+            await light.async_turn_off()
+        else:
+            await light.async_turn_on()
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+async def measure_command_rtt_in_storm(bench):
+    """Command round trips while every input keeps changing."""
+    storming = True
+
+    async def storm(device, ports):
+        value = 0
+        while storming:
+            value ^= 1
+            for port in ports:
+                await device.server.inject("input", port, value)
+            await asyncio.sleep(0)
+
+    storms = [
+        asyncio.create_task(storm(device, device.inputs)) for device in bench.devices
+    ]
+    try:
+        await asyncio.sleep(0.1)
+        return await measure_command_rtt(bench)
+    finally:
+        storming = False
+        await asyncio.gather(*storms)
+
+
+async def measure_scene(bench):
+    """Time to switch every light of every device in one go."""
+    lights = [
+        entity
+        for entity_platform in bench.platforms["light"]
+        for entity in entity_platform.entities.values()
+    ]
+    start = time.perf_counter()
+    await asyncio.gather(*(light.async_turn_on() for light in lights))
+    return (time.perf_counter() - start) * 1000
+
+
+async def measure_reflex_latency(bench):
+    """Input change until the relay driven by its reflex was confirmed."""
+    hubs = bench.hass.data[DOMAIN]
+    samples = []
+    for index in range(LATENCY_SAMPLES):
+        device = bench.devices[index % len(bench.devices)]
+        target = hubs[device.reflex_target]
+        value = 1 - target.evok_state_get("relay", REFLEX_PORT, 0)
+        future = asyncio.get_running_loop().create_future()
+        remove = target.async_add_listener(
+            "relay", REFLEX_PORT, lambda _: future.done() or future.set_result(None)
+        )
+        start = time.perf_counter()
+        try:
+            await device.server.inject("input", REFLEX_PORT, value)
+            await asyncio.wait_for(future, 5)
+        finally:
+            remove()
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def _relay_confirmed(hub, port, value):
+    """Return a future resolved with the time hub reports the relay at value."""
+    future = asyncio.get_running_loop().create_future()
+
+    def changed(new_value):
+        if new_value == value and not future.done():
+            future.set_result(time.perf_counter())
+
+    remove = hub.async_add_listener("relay", port, changed)
+    future.add_done_callback(lambda _: remove())
+    return future
+
+
+async def measure_cover(bench):
+    """Cover commands until the device confirmed the motor relay off.
+
+    Every sample opens a cover and times its stop, then moves it COVER_STEP
+    percent further up and compares the confirmed run with the run time of
+    that step. Returns the stop and the run error percentiles.
+    """
+    hubs = bench.hass.data[DOMAIN]
+    covers = [
+        (hubs[device.name], up, entity)
+        for device, entity_platform in zip(bench.devices, bench.platforms.get("cover", ()))
+        for (up, _), entity in zip(device.cover_ports, entity_platform.entities.values())
+    ]
+    if not covers:
+        return None, None
+    stops = []
+    run_errors = []
+    for index in range(COVER_SAMPLES):
+        hub, up, cover = covers[index % len(covers)]
+        started = _relay_confirmed(hub, up, 1)
+        await cover.async_open_cover()
+        await asyncio.wait_for(started, 5)
+        stopped = _relay_confirmed(hub, up, 0)
+        start = time.perf_counter()
+        await cover.async_stop_cover()
+        stops.append(await asyncio.wait_for(stopped, 5) - start)
+
+        position = cover.current_cover_position
+        target = int(position) + COVER_STEP
+        started = _relay_confirmed(hub, up, 1)
+        stopped = _relay_confirmed(hub, up, 0)
+        await cover.async_set_cover_position(position=target)
+        run = await asyncio.wait_for(stopped, 5) - await started
+        run_errors.append(abs(run - (target - position) / 100 * COVER_RUN_TIME))
+    return percentiles(stops), percentiles(run_errors)
+
+
+async def _async_drift(hass, device):
+    """Return the state of the DirectSwitch drift sensor of device."""
+    entity_id = er.async_get(hass).async_get_entity_id(
+        "sensor", DOMAIN, f"direct_switch_drift_at_{device.name}"
+    )
+    await async_update_entity(hass, entity_id)
+    return hass.states.get(entity_id).state
+
+
+async def measure_direct_switch(bench):
+    """Time to apply DirectSwitch rules that start in drift, checking the result.
+
+    Returns None for the Modbus transport, which sees the new configuration
+    only with the next full state sync.
+    """
+    hass = bench.hass
+    hubs = hass.data[DOMAIN]
+    devices = [device for device in bench.devices if device.modbus is None]
+    if not devices:
+        return None
+    for device in devices:
+        assert await _async_drift(hass, device) == "1", "DirectSwitch rule not in drift"
+
+    start = time.perf_counter()
+    await hass.services.async_call(DOMAIN, "apply_direct_switch", blocking=True)
+    # The device reports the new configuration back, which clears the drift
+    while any(hubs[device.name].direct_switch.drift for device in devices):
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    for device in devices:
+        assert await _async_drift(hass, device) == "0", "DirectSwitch drift not cleared"
+
+    # A press of the input now toggles the paired output on the device itself
+    for device in devices:
+        hub = hubs[device.name]
+        value = 1 - hub.evok_state_get("relay", DIRECT_SWITCH_PORT, 0)
+        future = asyncio.get_running_loop().create_future()
+        remove = hub.async_add_listener(
+            "relay", DIRECT_SWITCH_PORT, lambda _: future.done() or future.set_result(None)
+        )
+        try:
+            await device.server.inject("input", DIRECT_SWITCH_PORT, 1)
+            await device.server.inject("input", DIRECT_SWITCH_PORT, 0)
+            await asyncio.wait_for(future, 5)
+        finally:
+            remove()
+        assert hub.evok_state_get("relay", DIRECT_SWITCH_PORT) == value, "output not toggled"
+    return elapsed * 1000
+
+
+async def measure_stall_detection(bench):
+    """Seconds until a device that stopped answering is reconnected."""
+    device = bench.devices[0]
+    hub = bench.hass.data[DOMAIN][device.name]
+    reconnects = hub.reconnect_count
+    start = time.perf_counter()
+    device.server.stall_clients()
+    while hub.reconnect_count == reconnects:
+        await asyncio.sleep(0.01)
+    return time.perf_counter() - start
+
+
+async def measure_idle_cpu():
+    """Process CPU time per second while nothing changes, in percent."""
+    start = time.process_time()
+    await asyncio.sleep(IDLE_SECONDS)
+    return (time.process_time() - start) / IDLE_SECONDS * 100
+
+
+async def run_scenario(devices, circuits, transport):
+    bench = Benchmark(devices, circuits, transport)
+    try:
+        await bench.async_start()
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        await bench.async_add_entities()
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        entities = len(bench.entities)
+
+        waiter = StateWaiter(bench.hass)
+        result = {
+            "devices": devices,
+            "circuits_per_device": circuits,
+            "transport": transport,
+            "entities": entities,
+            "memory_bytes_per_entity": (after - before) / entities if entities else None,
+            "idle_cpu_percent": await measure_idle_cpu(),
+        }
+        cpu_start = time.process_time()
+        result["input_latency_ms"] = await measure_input_latency(bench, waiter)
+        result["updates_per_sec_per_device"] = await measure_throughput(bench, waiter)
+        result["command_rtt_ms"] = await measure_command_rtt(bench)
+        result["command_rtt_storm_ms"] = await measure_command_rtt_in_storm(bench)
+        result["scene_ms"] = await measure_scene(bench)
+        result["reflex_latency_ms"] = await measure_reflex_latency(bench)
+        result["cover_stop_ms"], result["cover_run_error_ms"] = await measure_cover(bench)
+        result["direct_switch_apply_ms"] = await measure_direct_switch(bench)
+        # Includes the fake servers, which run in the same process
+        result["cpu_seconds"] = time.process_time() - cpu_start
+        result["stall_detection_s"] = await measure_stall_detection(bench)
+    finally:
+        await bench.async_stop()
+    return result
+
+
+def integration_version():
+    with open(os.path.join(CUSTOM_COMPONENTS, "unipi_neuron", "manifest.json")) as manifest:
+        return json.load(manifest)["version"]
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--circuits", default="10,100,1000", help="circuits per device")
+    parser.add_argument("--devices", default="1,5,20", help="number of devices")
+    parser.add_argument("--transport", default="websocket", help="websocket, command, modbus and/or io_thread")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.ERROR)
+
+    results = []
+    for transport in args.transport.split(","):
+        for devices in (int(value) for value in args.devices.split(",")):
+            for circuits in (int(value) for value in args.circuits.split(",")):
+                print(
+                    f"Running {devices} device(s) x {circuits} circuits over {transport}",
+                    file=sys.stderr,
+                )
+                results.append(await run_scenario(devices, circuits, transport))
+
+    report = {
+        "integration_version": integration_version(),
+        "python": platform.python_version(),
+        "timestamp": time.time(),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
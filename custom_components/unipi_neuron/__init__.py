@@ -2,33 +2,108 @@
 import asyncio
 import json
 import logging
+import random
 
 import voluptuous as vol
-from evok_ws_client import *
 
 from homeassistant.config_entries import SOURCE_IMPORT, ConfigEntry
-from homeassistant.const import CONF_IP_ADDRESS, CONF_NAME, CONF_TYPE
+from homeassistant.const import (
+    CONF_DEVICE,
+    CONF_DEVICE_ID,
+    CONF_IP_ADDRESS,
+    CONF_NAME,
+    CONF_PORT,
+    CONF_SCAN_INTERVAL,
+    CONF_TYPE,
+    EVENT_HOMEASSISTANT_STOP,
+)
 from homeassistant.core import HomeAssistant
 import homeassistant.helpers.config_validation as cv
 from homeassistant.helpers.discovery import async_load_platform
-from homeassistant.helpers.dispatcher import async_dispatcher_send
 
-from .const import DOMAIN
+from .const import CONF_NEURON_TYPES, DOMAIN
+from .directswitch import (
+    CONF_DIRECT_SWITCH,
+    DIRECT_SWITCH_SCHEMA,
+    SERVICE_APPLY_DIRECT_SWITCH,
+    UnipiDirectSwitch,
+)
+from .discovery import UnipiDiscovery
+from .hub import DEFAULT_HEARTBEAT_INTERVAL, DEFAULT_HEARTBEAT_MISSES, UnipiNeuronHub
+from .modbus import (
+    CONF_COIL,
+    CONF_COUNT,
+    CONF_GROUP,
+    CONF_MODBUS,
+    CONF_REGISTER,
+    CONF_REGISTERS,
+    CONF_UNIT,
+    DEFAULT_MODBUS_PORT,
+    UnipiModbusLayout,
+    UnipiModbusTransport,
+)
+from .reflex import (
+    CONF_REFLEXES,
+    REFLEXES_SCHEMA,
+    UnipiReflexes,
+    validate_reflex_targets,
+)
+from .restore import async_load_restore_store
+from .worker import DATA_IO_WORKER, async_get_io_worker
 
 CONF_RECONNECT = "reconnect_time"
+CONF_COMMAND_CONNECTION = "command_connection"
+CONF_DISCOVERY = "discovery"
+CONF_HEARTBEAT_INTERVAL = "heartbeat_interval"
+CONF_HEARTBEAT_MISSES = "heartbeat_misses"
+CONF_IO_THREAD = "io_thread"
+
+# Base delay of the reconnect backoff; the configured reconnect_time caps it
+RECONNECT_BACKOFF_BASE = 0.5
+
+# Bitmap of count circuits group_01.. of an EVOK device, from bit 0 of register;
+# outputs are written as the coils from coil on
+MODBUS_REGISTERS_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_DEVICE): vol.Any("relay", "led", "input", "ro", "do", "di"),
+        vol.Required(CONF_GROUP): cv.positive_int,
+        vol.Required(CONF_REGISTER): vol.All(vol.Coerce(int), vol.Range(min=0, max=65535)),
+        vol.Required(CONF_COUNT): vol.All(vol.Coerce(int), vol.Range(min=1, max=99)),
+        vol.Optional(CONF_COIL): vol.All(vol.Coerce(int), vol.Range(min=0, max=65535)),
+    }
+)
+
+MODBUS_SCHEMA = vol.Schema(
+    {
+        vol.Optional(CONF_PORT, default=DEFAULT_MODBUS_PORT): cv.port,
+        vol.Optional(CONF_UNIT, default=0): vol.All(vol.Coerce(int), vol.Range(min=0, max=247)),
+        vol.Optional(CONF_SCAN_INTERVAL, default=0.1): cv.time_period_seconds,
+        vol.Required(CONF_REGISTERS): vol.All(cv.ensure_list, [MODBUS_REGISTERS_SCHEMA]),
+    }
+)
 
 DEVICE_SCHEMA = vol.Schema(
     {
         vol.Required(CONF_NAME): cv.string,
         vol.Required(CONF_IP_ADDRESS): cv.string,
         vol.Required(CONF_TYPE): vol.In(CONF_NEURON_TYPES),
-        vol.Optional(CONF_RECONNECT): cv.time_period_seconds
+        vol.Optional(CONF_RECONNECT): cv.time_period_seconds,
+        vol.Optional(CONF_MODBUS): MODBUS_SCHEMA,
+        vol.Optional(CONF_COMMAND_CONNECTION, default=False): cv.boolean,
+        vol.Optional(CONF_DISCOVERY, default=False): cv.boolean,
+        vol.Optional(
+            CONF_HEARTBEAT_INTERVAL, default=DEFAULT_HEARTBEAT_INTERVAL
+        ): cv.time_period_seconds,
+        vol.Optional(CONF_HEARTBEAT_MISSES, default=DEFAULT_HEARTBEAT_MISSES): cv.positive_int,
+        vol.Optional(CONF_IO_THREAD, default=False): cv.boolean,
+        vol.Optional(CONF_DIRECT_SWITCH): DIRECT_SWITCH_SCHEMA,
+        vol.Optional(CONF_REFLEXES): REFLEXES_SCHEMA,
     }
 )
 
 
 CONFIG_SCHEMA = vol.Schema(
-    {DOMAIN: vol.All(cv.ensure_list, [DEVICE_SCHEMA])},
+    {DOMAIN: vol.All(cv.ensure_list, [DEVICE_SCHEMA], validate_reflex_targets)},
     extra=vol.ALLOW_EXTRA,
 )
 
@@ -44,48 +119,167 @@ async def async_setup(hass, config):
         return True
 
     conf = config[DOMAIN]
+    discovered = []
+    # Estimated cover positions and light brightness of the last run
+    await async_load_restore_store(hass)
 
     for neuron_conf in conf:
         name = neuron_conf[CONF_NAME]
         ip_addr = neuron_conf[CONF_IP_ADDRESS]
-        entity_reconnect_time = neuron_conf[CONF_RECONNECT]
-        #default 30 seconds for reconnection to unipi device
+        entity_reconnect_time = neuron_conf.get(CONF_RECONNECT)
+        #default 30 seconds max. delay between reconnections to unipi device
         reconnect_seconds = 30
         if entity_reconnect_time is not None:
             reconnect_seconds = entity_reconnect_time.seconds
 
         _LOGGER.info("Setting up Neuron %s on IP:%s", name, ip_addr)
-        neuron = UnipiEvokWsClient(ip_addr, neuron_conf[CONF_TYPE], name)
-
-        hass.loop.create_task(evok_connection(hass, neuron, reconnect_seconds))
+        neuron = UnipiNeuronHub(hass, ip_addr, neuron_conf[CONF_TYPE], name)
+        modbus_conf = neuron_conf.get(CONF_MODBUS)
+        if modbus_conf is not None:
+            neuron.async_set_modbus(
+                UnipiModbusTransport(
+                    neuron,
+                    ip_addr.split(":")[0],
+                    modbus_conf[CONF_PORT],
+                    modbus_conf[CONF_UNIT],
+                    UnipiModbusLayout(modbus_conf[CONF_REGISTERS]),
+                    modbus_conf[CONF_SCAN_INTERVAL].total_seconds(),
+                )
+            )
+        if CONF_DIRECT_SWITCH in neuron_conf:
+            neuron.async_set_direct_switch(
+                UnipiDirectSwitch(neuron, neuron_conf[CONF_DIRECT_SWITCH])
+            )
+        if neuron_conf[CONF_IO_THREAD]:
+            # One thread serves the devices of all Neurons that opt in
+            neuron.async_set_io_worker(async_get_io_worker(hass))
+        # All devices connect concurrently; entities pick up the state
+        # from the hub cache as soon as it is there
+        heartbeat = (
+            neuron_conf[CONF_HEARTBEAT_INTERVAL].total_seconds(),
+            neuron_conf[CONF_HEARTBEAT_MISSES],
+        )
+        command_connection = None
+        if neuron_conf[CONF_COMMAND_CONNECTION]:
+            command_connection = evok_command_connection(
+                hass, neuron, reconnect_seconds, heartbeat
+            )
+        neuron.async_start(
+            evok_connection(hass, neuron, reconnect_seconds, heartbeat), command_connection
+        )
         hass.data[DOMAIN][name] = neuron
-    return True
+        if neuron_conf[CONF_DISCOVERY]:
+            discovered.append(neuron)
 
+    # Reflexes may target any Neuron, so they are compiled once all exist
+    for neuron_conf in conf:
+        if CONF_REFLEXES in neuron_conf:
+            neuron = hass.data[DOMAIN][neuron_conf[CONF_NAME]]
+            neuron.async_set_reflexes(
+                UnipiReflexes(hass, neuron, neuron_conf[CONF_REFLEXES], hass.data[DOMAIN])
+            )
+
+    # Entities for the circuits not configured in YAML
+    if discovered:
+        await UnipiDiscovery(hass, config, discovered).async_setup()
+
+    # Diagnostic sensors with the connection metrics of every Neuron
+    hass.async_create_task(
+        async_load_platform(
+            hass, "sensor", DOMAIN, {"devices": list(hass.data[DOMAIN])}, config
+        )
+    )
+
+    async def async_apply_direct_switch(call):
+        """Write the DirectSwitch rules that differ from the device configuration."""
+        names = [call.data[CONF_DEVICE_ID]] if CONF_DEVICE_ID in call.data else hass.data[DOMAIN]
+        await asyncio.gather(
+            *(
+                hass.data[DOMAIN][name].direct_switch.async_apply()
+                for name in names
+                if hass.data[DOMAIN][name].direct_switch is not None
+            )
+        )
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_APPLY_DIRECT_SWITCH,
+        async_apply_direct_switch,
+        schema=vol.Schema({vol.Optional(CONF_DEVICE_ID): vol.In(list(hass.data[DOMAIN]))}),
+    )
+
+    async def async_stop_neurons(event):
+        await asyncio.gather(
+            *(neuron.async_stop() for neuron in hass.data[DOMAIN].values())
+        )
+        worker = hass.data.pop(DATA_IO_WORKER, None)
+        if worker is not None:
+            await worker.async_stop()
+
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_stop_neurons)
+    return True
 
 
-async def evok_connection(hass, neuron, reconnect_seconds):
 
-    def evok_update_dispatch_send(name, device, circuit, value):
-        _LOGGER.debug("SENDING Dispacher on %s %s", device, circuit)
-        async_dispatcher_send(hass, f"{DOMAIN}_{name}_{device}_{circuit}")
+async def evok_connection(hass, neuron, reconnect_seconds, heartbeat):
 
     # Keep connection and subscription to websocket server on Unipi
-    # Reconnect if connection is lost
-    _connected = False
+    # Reconnect if connection is lost, or at once when the heartbeat stops
+    attempt = 0
     while True:
         await neuron.evok_close()
-        if not await neuron.evok_connect():
-            _connected = False
-            #Try to connect every X seconds
-            await asyncio.sleep(reconnect_seconds)
-            continue
-
-        _connected = True
-        await neuron.evok_register_default_filter_dev()
-        await neuron.evok_full_state_sync()
-
-        while True:
-            if not await neuron.evok_receive(True, evok_update_dispatch_send):
-                _connected = False
-                break
+        if await neuron.evok_connect():
+            try:
+                await neuron.evok_register_filter()
+                # Only circuits that differ from the cached state get dispatched
+                await neuron.evok_full_state_sync()
+            except Exception as err:  # pylint: disable=broad-except
+                _LOGGER.warning("Subscribing to %s failed: %s", neuron._name, err)
+            else:
+                heartbeat_task = hass.async_create_background_task(
+                    neuron.evok_heartbeat(*heartbeat), f"{neuron._name} EVOK heartbeat"
+                )
+                try:
+                    while await neuron.evok_receive():
+                        if neuron.synced:
+                            attempt = 0
+                finally:
+                    heartbeat_task.cancel()
+
+        #Retry at once, then back off exponentially up to X seconds
+        delay = reconnect_delay(attempt, reconnect_seconds)
+        attempt += 1
+        if delay:
+            _LOGGER.debug("Reconnecting to %s in %.1f s", neuron._name, delay)
+            await asyncio.sleep(delay)
+
+
+async def evok_command_connection(hass, neuron, reconnect_seconds, heartbeat):
+    # Keep the command connection to the Unipi up, independently of the
+    # event connection; commands use the event connection while it is down
+    attempt = 0
+    while True:
+        # Without a miss counter, ping less often than the event connection
+        if await neuron.evok_command_connect(heartbeat[0] * heartbeat[1]):
+            attempt = 0
+            try:
+                while await neuron.evok_command_receive():
+                    pass
+            finally:
+                await neuron.evok_command_close()
+
+        delay = reconnect_delay(attempt, reconnect_seconds)
+        attempt += 1
+        if delay:
+            _LOGGER.debug("Reconnecting commands to %s in %.1f s", neuron._name, delay)
+            await asyncio.sleep(delay)
+
+
+def reconnect_delay(attempt, max_delay):
+    """Return the delay before reconnect attempt number attempt."""
+    if attempt == 0:
+        return 0
+    delay = min(max_delay, RECONNECT_BACKOFF_BASE * 2 ** (attempt - 1))
+    # Jitter, so devices behind the same flaky link do not retry in lockstep
+    return random.uniform(delay / 2, delay)
 
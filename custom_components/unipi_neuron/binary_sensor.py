@@ -3,6 +3,8 @@ import logging
 
 import voluptuous as vol
 
+from homeassistant.core import callback
+
 from homeassistant.components.binary_sensor import (
     DEVICE_CLASSES_SCHEMA,
     PLATFORM_SCHEMA,
@@ -18,18 +20,30 @@ from homeassistant.const import (
 )
 
 import homeassistant.helpers.config_validation as cv
-from homeassistant.helpers.dispatcher import async_dispatcher_connect
 
-from .const import DOMAIN
+from .const import CIRCUIT_REGEX, DOMAIN
+from .scheduler import async_get_scheduler
 
 _LOGGER = logging.getLogger(__name__)
 
+CONF_DEBOUNCE = "debounce"
+CONF_DEBOUNCE_MODE = "debounce_mode"
+
+#leading: report the first edge at once, then ignore the input for the debounce time
+#trailing: report the input once it was stable for the debounce time
+DEBOUNCE_LEADING = "leading"
+DEBOUNCE_TRAILING = "trailing"
+
 # Validation of the user's configuration
 DEVICE_SCHEMA = vol.Schema(
     {
         vol.Required(CONF_NAME): cv.string,
         vol.Required(CONF_DEVICE): vol.Any("input", "di"),
-        vol.Required(CONF_PORT): cv.matches_regex(r"^[1-9]_[0-1][0-9]$|^1[0-2]$|^[1-9]$"),
+        vol.Required(CONF_PORT): cv.matches_regex(CIRCUIT_REGEX),
+        vol.Optional(CONF_DEBOUNCE, default=0): cv.time_period_seconds,
+        vol.Optional(CONF_DEBOUNCE_MODE, default=DEBOUNCE_TRAILING): vol.Any(
+            DEBOUNCE_LEADING, DEBOUNCE_TRAILING
+        ),
     }
 )
 
@@ -42,16 +56,28 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
 
 async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
     """Set up Binary Sensor for Unipi."""
+    if discovery_info is not None:
+        # Circuits found by discovery that are not configured in YAML
+        unipi_hub = hass.data[DOMAIN][discovery_info[CONF_DEVICE_ID]]
+        async_add_entities(
+            UnipiBinarySensor(unipi_hub, f"{unipi_hub._name} {device} {port}", port, device)
+            for device, port in discovery_info["circuits"]
+        )
+        return
+
     _LOGGER.info("Setup platform for Unipi Binary Sensor %s", config)
     unipi_device_name = config[CONF_DEVICE_ID]
     binary_sensors = []
     for sensor in config[CONF_DEVICES]:
+        hass.data[DOMAIN][unipi_device_name].async_claim(sensor[CONF_DEVICE], sensor[CONF_PORT])
         binary_sensors.append(
             UnipiBinarySensor(
                 hass.data[DOMAIN][unipi_device_name],
                 sensor[CONF_NAME],
                 sensor[CONF_PORT],
                 sensor[CONF_DEVICE],
+                sensor[CONF_DEBOUNCE],
+                sensor[CONF_DEBOUNCE_MODE],
             )
         )
 
@@ -62,20 +88,35 @@ async def async_setup_platform(hass, config, async_add_entities, discovery_info=
 class UnipiBinarySensor(BinarySensorEntity):
     """Representation of binary sensors as digital input on Unipi Device."""
 
-    def __init__(self, unipi_hub, name, port, device):
+    _attr_should_poll = False
+
+    def __init__(self, unipi_hub, name, port, device, debounce=None, debounce_mode=DEBOUNCE_TRAILING):
         """Initialize Unipi binary sensor."""
         self._unipi_hub = unipi_hub
         self._name = name
         self._port = port
         self._device = device
         self._state = None
+        # Last value reported by the device, before debouncing
+        self._raw_state = None
+        self._debounce = debounce.total_seconds() if debounce else 0
+        self._debounce_mode = debounce_mode
+        self._debounce_timer = None
 
     async def async_added_to_hass(self):
         """Register device notification."""
         #await self.async_initialize_device(self._ads_var, self._ads_hub.PLCTYPE_BOOL)
-        signal = f"{DOMAIN}_{self._unipi_hub._name}_{self._device}_{self._port}"
-        _LOGGER.debug("Binary Sensor: Connecting %s", signal)
-        async_dispatcher_connect(self.hass, signal, self._update_callback)
+        _LOGGER.debug("Binary Sensor: Connecting %s %s", self._device, self._port)
+        self.async_on_remove(
+            self._unipi_hub.async_add_listener(self._device, self._port, self._update_callback)
+        )
+        self.async_on_remove(self._unipi_hub.async_add_entity(self))
+        # Start from the cached state if the device already reported it
+        value = self._unipi_hub.evok_state_get(self._device, self._port, None)
+        if value is not None:
+            self._state = self._raw_state = value == 1
+        if self._debounce:
+            self.async_on_remove(self._cancel_debounce_timer)
 
     @property
     def is_on(self):
@@ -92,6 +133,11 @@ class UnipiBinarySensor(BinarySensorEntity):
         """Return the unique ID of this binary sensor entity."""
         return f"{self._device}_{self._port}_at_{self._unipi_hub._name}"
 
+    @property
+    def available(self):
+        """Return True while the Neuron is connected."""
+        return self._unipi_hub.available
+
     # @property
     # def device_class(self):
     #     """Return the device class."""
@@ -104,7 +150,44 @@ class UnipiBinarySensor(BinarySensorEntity):
     #     _LOGGER.info("Update binary sensor %s", self._name)
     #     self._state = self._unipi_hub.evok_state_get(self._device, self._port) == 1
 
-    def _update_callback(self):
+    @callback
+    def _update_callback(self, value):
         """State has changed"""
-        self._state = self._unipi_hub.evok_state_get(self._device, self._port) == 1
-        self.schedule_update_ha_state()
+        self._raw_state = value == 1
+        if not self._debounce:
+            self._set_state(self._raw_state)
+        elif self._debounce_mode == DEBOUNCE_LEADING:
+            if self._debounce_timer is None:
+                self._set_state(self._raw_state)
+                self._start_debounce_timer()
+        else:
+            self._cancel_debounce_timer()
+            self._start_debounce_timer()
+
+    @callback
+    def _debounce_timeout(self):
+        """The input was quiet for the debounce time."""
+        self._debounce_timer = None
+        if self._raw_state == self._state:
+            return
+        self._set_state(self._raw_state)
+        if self._debounce_mode == DEBOUNCE_LEADING:
+            # The edge that ended the debounce time is a new leading edge
+            self._start_debounce_timer()
+
+    @callback
+    def _start_debounce_timer(self):
+        self._debounce_timer = async_get_scheduler(self.hass).async_schedule(
+            self._debounce, self._debounce_timeout
+        )
+
+    @callback
+    def _cancel_debounce_timer(self):
+        if self._debounce_timer is not None:
+            self._debounce_timer()
+            self._debounce_timer = None
+
+    @callback
+    def _set_state(self, state):
+        self._state = state
+        self._unipi_hub.async_schedule_write(self)
@@ -1,3 +1,16 @@
 """Constants for the unipi_neuron integration."""
 
 DOMAIN = "unipi_neuron"
+
+# Neuron types accepted in the configuration (unused otherwise)
+CONF_NEURON_TYPES = ["L203", "M203", "S203"]
+
+# EVOK devices always registered in the websocket notification filter
+EVOK_FILTER_DEVICES = ["relay", "led", "input", "ro", "do", "di"]
+
+# EVOK circuit names: "group_index" (e.g. "2_01", extension modules
+# "UART_1_01_01") or a plain number on older EVOK versions
+CIRCUIT_REGEX = r"^(?:UART_)?(?:[1-9]|1[0-5])_[0-1]?[0-9](?:_0[0-9])?$|^(?:[1-9]|1[0-2])$"
+
+# 1-Wire sensors are addressed by their 64 bit ROM code
+ONEWIRE_ADDRESS_REGEX = r"^[0-9A-Fa-f]{16}$"
@@ -1,4 +1,5 @@
 """Support for covers with unipi components."""
+import asyncio
 import logging
 
 import voluptuous as vol
@@ -32,11 +33,11 @@ from homeassistant.core import callback
 from homeassistant.exceptions import TemplateError
 import homeassistant.helpers.config_validation as cv
 from homeassistant.helpers.script import Script
-from homeassistant.helpers.dispatcher import async_dispatcher_connect
-from homeassistant.helpers.event import async_call_later
-from datetime import datetime, timedelta
 
-from .const import DOMAIN
+from .const import CIRCUIT_REGEX, DOMAIN
+from .hub import PRIORITY_SAFETY
+from .restore import async_get_restore_store
+from .scheduler import async_get_scheduler
 
 _LOGGER = logging.getLogger(__name__)
 _VALID_STATES = [STATE_OPEN, STATE_CLOSED, STATE_OPENING, STATE_CLOSING]
@@ -58,6 +59,11 @@ CONF_FULL_CLOSE_TIME = "full_close_time"
 CONF_FULL_OPEN_TIME = "full_open_time"
 CONF_TILT_CHANGE_TIME = "tilt_change_time"
 CONF_MIN_REVERSE_DIR_TIME = "min_reverse_dir_time"
+CONF_DEVICE_TIMER = "device_timer"
+
+#with device_timer the backup stop fires this many seconds after the
+#device should have ended the move
+DEVICE_TIMER_BACKUP = 1
 
 TILT_FEATURES = (
     CoverEntityFeature.OPEN
@@ -74,12 +80,13 @@ COVER_SCHEMA = vol.Schema(
     {
         vol.Required(CONF_NAME): cv.string,
         vol.Required(CONF_DEVICE): vol.Any("relay", "led", "ro"),
-        vol.Required(CONF_PORT_UP): cv.matches_regex(r"^[1-9]_[0-1][0-9]|[1-8]"),
-        vol.Required(CONF_PORT_DOWN): cv.matches_regex(r"^[1-9]_[0-1][0-9]|[1-8]"),
+        vol.Required(CONF_PORT_UP): cv.matches_regex(CIRCUIT_REGEX),
+        vol.Required(CONF_PORT_DOWN): cv.matches_regex(CIRCUIT_REGEX),
         vol.Required(CONF_FULL_CLOSE_TIME): cv.time_period_seconds,
         vol.Required(CONF_FULL_OPEN_TIME): cv.time_period_seconds,
         vol.Required(CONF_TILT_CHANGE_TIME): cv.time_period_seconds,
         vol.Required(CONF_MIN_REVERSE_DIR_TIME): cv.time_period_seconds,
+        vol.Optional(CONF_DEVICE_TIMER, default=False): cv.boolean,
 
         vol.Optional(CONF_ICON_TEMPLATE): cv.template,
         vol.Optional(CONF_ENTITY_PICTURE_TEMPLATE): cv.template,
@@ -118,6 +125,9 @@ async def async_setup_platform(hass, config, async_add_entities, discovery_info=
         full_open_time = device_config.get(CONF_FULL_OPEN_TIME)
         tilt_change_time = device_config.get(CONF_TILT_CHANGE_TIME)
         min_reverse_time = device_config.get(CONF_MIN_REVERSE_DIR_TIME)
+        device_timer = device_config.get(CONF_DEVICE_TIMER, False)
+        hass.data[DOMAIN][unipi_device_name].async_claim(unipi_device_class, port_up)
+        hass.data[DOMAIN][unipi_device_name].async_claim(unipi_device_class, port_down)
 
 
         template_entity_ids = set()
@@ -147,10 +157,12 @@ async def async_setup_platform(hass, config, async_add_entities, discovery_info=
                 tilt_change_time,
                 full_open_time,
                 full_close_time,
+                min_reverse_time,
                 device_class,
                 icon_template,
                 entity_picture_template,
                 entity_ids,
+                device_timer,
             )
         )
     if not covers:
@@ -175,10 +187,12 @@ class UnipiCover(CoverEntity):
         tilt_change_time,
         full_open_time,
         full_close_time,
+        min_reverse_time,
         device_class,
         icon_template,
         entity_picture_template,
         entity_ids,
+        device_timer=False,
     ):
         """Initialize the shades."""
         self._unipi_hub = unipi_hub
@@ -186,18 +200,32 @@ class UnipiCover(CoverEntity):
         self._port_down = port_down
         self._device = unipi_device_class
         self._name = friendly_name
-        self._tilt_change_time = tilt_change_time/timedelta(microseconds=1000)/1000
-        self._full_open_time = int(full_open_time.seconds)
-        self._full_close_time = int(full_close_time.seconds)
+        #all times in seconds, as floats
+        self._tilt_change_time = tilt_change_time.total_seconds()
+        self._full_open_time = full_open_time.total_seconds()
+        self._full_close_time = full_close_time.total_seconds()
+        self._min_reverse_time = min_reverse_time.total_seconds()
 
         #config state
         self._config_state = STATE_IDLE
         #confirmed state from nauron
         self._oper_state = None
 
-        self._time_last_movement_start = 0
+        #loop.time() of the last movement start, None when not moving
+        self._time_last_movement_start = None
+        self._motor_driver_up_state = False
+        self._motor_driver_down_state = False
 
+        #deadlines are owned by the integration wide scheduler
+        self._scheduler = None
         self._stop_cover_timer = None
+        self._cooldown_timer = None
+        #run time of a timed move whose motor start is not confirmed yet
+        self._pending_run_time = None
+        #timed moves are ended by the Neuron, with the scheduler as backup
+        self._device_timer = device_timer
+        #True while the Neuron is timing the current move
+        self._device_timed = False
 
         self._friendly_name = friendly_name
         self._icon_template = icon_template
@@ -208,19 +236,41 @@ class UnipiCover(CoverEntity):
         self._entity_picture = None
         self._position = None
         self._tilt_value = None
+        self._restore_store = None
         self._entities = entity_ids
         self._available = True
 
     async def async_added_to_hass(self):
         """Register callbacks."""
 
-        signal = f"{DOMAIN}_{self._unipi_hub._name}_{self._device}_{self._port_up}"
-        _LOGGER.debug("connecting %s", signal)
-        async_dispatcher_connect(self.hass, signal, self._output_update_callback)
+        self._scheduler = async_get_scheduler(self.hass)
+        self.async_on_remove(self._cancel_any_pending_stop_cover_timers)
+
+        # Continue from the position estimated before the restart, so no
+        # calibration run is needed
+        self._restore_store = async_get_restore_store(self.hass)
+        restored, remove = self._restore_store.async_restore(self.unique_id, self._dump_state)
+        self.async_on_remove(remove)
+        if restored is not None and self._position is None:
+            self._position = restored.get("position")
+            self._tilt_value = restored.get("tilt")
+
+        _LOGGER.debug("connecting %s %s and %s", self._device, self._port_up, self._port_down)
+        self.async_on_remove(
+            self._unipi_hub.async_add_listener(self._device, self._port_up, self._port_up_update_callback)
+        )
+        self.async_on_remove(
+            self._unipi_hub.async_add_listener(self._device, self._port_down, self._port_down_update_callback)
+        )
+        self.async_on_remove(self._unipi_hub.async_add_entity(self))
 
-        signal = f"{DOMAIN}_{self._unipi_hub._name}_{self._device}_{self._port_down}"
-        _LOGGER.debug("connecting %s", signal)
-        async_dispatcher_connect(self.hass, signal, self._output_update_callback)
+        # Start from the cached state if the device already reported it
+        up_state = self._unipi_hub.evok_state_get(self._device, self._port_up, None)
+        down_state = self._unipi_hub.evok_state_get(self._device, self._port_down, None)
+        if up_state is not None or down_state is not None:
+            self._motor_driver_up_state = up_state == 1
+            self._motor_driver_down_state = down_state == 1
+            self._output_update_callback()
 
 
     @property
@@ -292,7 +342,7 @@ class UnipiCover(CoverEntity):
     @property
     def available(self) -> bool:
         """Return if the device is available."""
-        return self._available
+        return self._available and self._unipi_hub.available
 
     async def async_open_cover(self, **kwargs):
         """Move the cover up."""
@@ -300,11 +350,20 @@ class UnipiCover(CoverEntity):
         #if cover is closing (and want to open it) this translatest to stop it
         if (self._oper_state == STATE_CLOSING):
             await self._stop()
+        elif self._config_state == STATE_OPENING:
+            #already opening, a new position restarts the run with its run time
+            if self._pending_run_time is not None:
+                await self._start_motor(self._port_up)
         elif ((self._oper_state == STATE_IDLE) and (self._config_state == STATE_IDLE)) or (self._config_state == STATE_OPENING_COOLDOWN):
             self._config_state = STATE_OPENING
             #just to be on the safe side also set down to 0
-            await self._unipi_hub.evok_send(self._device, self._port_down, "0")
-            await self._unipi_hub.evok_send(self._device, self._port_up, "1")
+            #(as an interlock it is sent before up)
+            await asyncio.gather(
+                self._unipi_hub.evok_send(
+                    self._device, self._port_down, "0", force=True, priority=PRIORITY_SAFETY
+                ),
+                self._start_motor(self._port_up),
+            )
             _LOGGER.info("Cover OPENING %s", self._config_state)
 
     async def async_close_cover(self, **kwargs):
@@ -313,16 +372,64 @@ class UnipiCover(CoverEntity):
         #if cover is opening (and want to close it) this translatest to stop it
         if (self._oper_state == STATE_OPENING):
             await self._stop()
+        elif self._config_state == STATE_CLOSING:
+            #already closing, a new position restarts the run with its run time
+            if self._pending_run_time is not None:
+                await self._start_motor(self._port_down)
         elif ((self._oper_state == STATE_IDLE) and (self._config_state == STATE_IDLE)) or (self._config_state == STATE_CLOSING_COOLDOWN):
             self._config_state = STATE_CLOSING
             #just to be on the safe side also set up to 0
-            await self._unipi_hub.evok_send(self._device, self._port_up, "0")
-            await self._unipi_hub.evok_send(self._device, self._port_down, "1")
+            #(as an interlock it is sent before down)
+            await asyncio.gather(
+                self._unipi_hub.evok_send(
+                    self._device, self._port_up, "0", force=True, priority=PRIORITY_SAFETY
+                ),
+                self._start_motor(self._port_down),
+            )
             _LOGGER.info("Cover CLOSING %s", self._config_state)
 
 
-    @callback
-    async def _stop_cover_timeout(self, _):
+    async def _start_motor(self, port):
+        """Switch on the motor driver output port.
+
+        With device_timer a timed move is sent with an EVOK relay timeout,
+        so the Neuron switches the output off again by itself. Sent while
+        the motor already runs, the new timeout replaces the running one.
+        """
+        run_time = self._pending_run_time
+        if self._oper_state != OPER_STATE_IDLE:
+            #no start will be echoed to anchor the stop, it counts from now
+            self._pending_run_time = None
+        if not self._device_timer or run_time is None:
+            await self._unipi_hub.evok_send(self._device, port, "1")
+            return
+        self._device_timed = True
+        #the device stops the motor, keep the stop timer only as a backup
+        if self._stop_cover_timer:
+            self._stop_cover_timer()
+        self._stop_cover_timer = self._scheduler.async_schedule(
+            run_time + DEVICE_TIMER_BACKUP, self._stop_cover_timeout
+        )
+        await self._unipi_hub.evok_send(
+            self._device,
+            port,
+            {"value": "1", "timeout": round(run_time, 3)},
+            force=True,
+        )
+
+    def _schedule_stop(self, run_time):
+        """Stop the motor once it has run for run_time seconds.
+
+        The deadline is anchored when the device confirms the motor start
+        (see _output_update_callback). Until then, a stop run_time from now
+        covers a start that is never confirmed.
+        """
+        self._cancel_any_pending_stop_cover_timers()
+        self._pending_run_time = run_time
+        self._stop_cover_timer = self._scheduler.async_schedule(run_time, self._stop_cover_timeout)
+
+    async def _stop_cover_timeout(self):
+        self._stop_cover_timer = None
         await self._stop()
 
     async def async_stop_cover(self, **kwargs):
@@ -332,22 +439,41 @@ class UnipiCover(CoverEntity):
         self._cancel_any_pending_stop_cover_timers()
         if self._oper_state == STATE_OPENING:
             self._config_state = STATE_OPENING_COOLDOWN
-            async_call_later(self.hass, 1, self._cooldown_sate)
+            self._start_cooldown()
         elif self._oper_state == STATE_CLOSING:
             self._config_state = STATE_CLOSING_COOLDOWN
-            async_call_later(self.hass, 1, self._cooldown_sate)
+            self._start_cooldown()
         elif (self._oper_state == STATE_IDLE) and ((self._config_state == STATE_OPENING) or (self._config_state == STATE_CLOSING)):
             #this should not happen but it does (when??). Anyhow this is a generic WA :)
             _LOGGER.error("Cover oper state in IDLE but config state in %s", self._config_state)
             self._config_state = STATE_GENERIC_COOLDOWN
-            async_call_later(self.hass, 1, self._cooldown_sate)
+            self._start_cooldown()
+
+        await asyncio.gather(
+            self._unipi_hub.evok_send(self._device, self._port_up, "0", priority=PRIORITY_SAFETY),
+            self._unipi_hub.evok_send(self._device, self._port_down, "0", priority=PRIORITY_SAFETY),
+        )
 
-        await self._unipi_hub.evok_send(self._device, self._port_up, "0")
-        await self._unipi_hub.evok_send(self._device, self._port_down, "0")
 
+    def _device_timed_move_done(self):
+        """The Neuron ended a timed move; cool down as after a stop."""
+        self._cancel_any_pending_stop_cover_timers()
+        if self._config_state == STATE_OPENING:
+            self._config_state = STATE_OPENING_COOLDOWN
+            self._start_cooldown()
+        elif self._config_state == STATE_CLOSING:
+            self._config_state = STATE_CLOSING_COOLDOWN
+            self._start_cooldown()
 
-    async def _cooldown_sate(self, *_):
-        #needs work!!!
+    def _start_cooldown(self):
+        """Block reversing the motor for min_reverse_dir_time."""
+        if self._cooldown_timer:
+            self._cooldown_timer()
+        self._cooldown_timer = self._scheduler.async_schedule(self._min_reverse_time, self._cooldown_sate)
+
+    @callback
+    def _cooldown_sate(self):
+        self._cooldown_timer = None
         self._config_state = STATE_IDLE
 
 
@@ -365,15 +491,13 @@ class UnipiCover(CoverEntity):
         #if we don't yet know the position of the cover, only 0 and 100 is excepted
         if (self._position == None):
             if new_position == 0:
-                self._cancel_any_pending_stop_cover_timers()
+                self._schedule_stop(self._full_close_time)
                 await self.async_close_cover()
-                self._stop_cover_timer = async_call_later(self.hass, self._full_close_time, self._stop_cover_timeout)
             elif new_position == 100:
-                self._cancel_any_pending_stop_cover_timers()
+                self._schedule_stop(self._full_open_time)
                 await self.async_open_cover()
-                self._stop_cover_timer = async_call_later(self.hass, self._full_open_time, self._stop_cover_timeout)
         else:
-            position, tilt = current_state = self._get_position_and_tilt(self._oper_state, self._time_last_movement_start, datetime.now(), False)
+            position, tilt = current_state = self._get_position_and_tilt(self._oper_state, self._time_last_movement_start, self.hass.loop.time(), False)
             stop_timer = 0
             #if new position is 100 or 0, add additional time (1/10th), to "fix" any nonlinearity from previous movements
             #and to drive the motors also in case our internal thinks we are fully opened or closed
@@ -384,14 +508,12 @@ class UnipiCover(CoverEntity):
 
             if new_position > position:
                 stop_timer = (new_position - position)*self._full_open_time/100
-                self._cancel_any_pending_stop_cover_timers()
+                self._schedule_stop(stop_timer)
                 await self.async_open_cover()
-                self._stop_cover_timer = async_call_later(self.hass, stop_timer, self._stop_cover_timeout)
             if new_position < position:
-                stop_timer = (position - new_position)*self._full_open_time/100
-                self._cancel_any_pending_stop_cover_timers()
+                stop_timer = (position - new_position)*self._full_close_time/100
+                self._schedule_stop(stop_timer)
                 await self.async_close_cover()
-                self._stop_cover_timer = async_call_later(self.hass, stop_timer, self._stop_cover_timeout)
 
             _LOGGER.info("Setting cover %s to position %d; timeout %d", self._friendly_name, new_position, stop_timer)
 
@@ -416,26 +538,22 @@ class UnipiCover(CoverEntity):
 
         if (self._tilt_value == None):
             if new_tilt_value == 0:
-                self._cancel_any_pending_stop_cover_timers()
+                self._schedule_stop(self._tilt_change_time)
                 await self.async_close_cover()
-                self._stop_cover_timer = async_call_later(self.hass, self._tilt_change_time, self._stop_cover_timeout)
             elif new_tilt_value == 100:
-                self._cancel_any_pending_stop_cover_timers()
+                self._schedule_stop(self._tilt_change_time)
                 await self.async_open_cover()
-                self._stop_cover_timer = async_call_later(self.hass, self._tilt_change_time, self._stop_cover_timeout)
         else:
-            position, tilt = current_state = self._get_position_and_tilt(self._oper_state, self._time_last_movement_start, datetime.now(), False)
+            position, tilt = current_state = self._get_position_and_tilt(self._oper_state, self._time_last_movement_start, self.hass.loop.time(), False)
 
             if new_tilt_value > tilt:
                 stop_timer = (new_tilt_value - tilt)*self._tilt_change_time/100
-                self._cancel_any_pending_stop_cover_timers()
+                self._schedule_stop(stop_timer)
                 await self.async_open_cover()
-                self._stop_cover_timer = async_call_later(self.hass, stop_timer, self._stop_cover_timeout)
             if new_tilt_value < tilt:
                 stop_timer = (tilt - new_tilt_value)*self._tilt_change_time/100
-                self._cancel_any_pending_stop_cover_timers()
+                self._schedule_stop(stop_timer)
                 await self.async_close_cover()
-                self._stop_cover_timer = async_call_later(self.hass, stop_timer, self._stop_cover_timeout)
 
 
         _LOGGER.info("Setting cover %s tilt to  %d", self._friendly_name, new_tilt_value)
@@ -481,93 +599,96 @@ class UnipiCover(CoverEntity):
                     )
 
     def _get_position_and_tilt(self, oper_state, start_time, stop_time, update = False):
-        if start_time == 0 or oper_state not in (OPER_STATE_OPENING, OPER_STATE_CLOSING):
+        """Estimate position and tilt after moving from start_time to stop_time.
+
+        Both times are loop.time() seconds.
+        """
+        if start_time is None or oper_state not in (OPER_STATE_OPENING, OPER_STATE_CLOSING):
             return (self._position, self._tilt_value)
 
         if start_time > stop_time:
-            _LOGGER.error("Posoition/tilt time error %s start: %d, stop: %d",
-                        friendly_property_name,
+            _LOGGER.error("Position/tilt time error %s start: %.3f, stop: %.3f",
+                        self._name,
                         start_time,
                         stop_time,
                     )
-            return
+            return (self._position, self._tilt_value)
 
-        deltatime = (stop_time - start_time)/timedelta(microseconds=1000)
-        print("Delatatime is", deltatime, " Tiltchaneg is", self._tilt_change_time)
+        deltatime = stop_time - start_time
         new_position_value = None
         new_tilt_value = None
 
         #tilt
         if oper_state == OPER_STATE_OPENING:
-            if deltatime >= self._tilt_change_time*1000:
+            if deltatime >= self._tilt_change_time:
                 new_tilt_value = 100
-            else:
-                tilt_change = deltatime*100/self._tilt_change_time/1000
-                try:
-                    new_tilt_value = self._tilt_value + tilt_change
-                    if new_tilt_value > 100:
-                        new_tilt_value = 100
-                except:
-                    pass
+            elif self._tilt_value is not None:
+                new_tilt_value = min(100, self._tilt_value + deltatime*100/self._tilt_change_time)
 
         if oper_state == OPER_STATE_CLOSING:
-            if deltatime >= self._tilt_change_time*1000:
+            if deltatime >= self._tilt_change_time:
                 new_tilt_value = 0
-            else:
-                tilt_change = deltatime*100/self._tilt_change_time/1000
-                try:
-                    new_tilt_value = self._tilt_value - tilt_change
-                    if new_tilt_value < 0:
-                        new_tilt_value = 0
-                except:
-                    pass
-
+            elif self._tilt_value is not None:
+                new_tilt_value = max(0, self._tilt_value - deltatime*100/self._tilt_change_time)
 
         #position
         if oper_state == OPER_STATE_OPENING:
-            if deltatime >= self._full_open_time*1000:
+            if deltatime >= self._full_open_time:
                 new_position_value = 100
-            else:
-                position_change = deltatime*100/(self._full_open_time*1000)
-                try:
-                    new_position_value = self._position + position_change
-                    if new_position_value > 100:
-                        new_position_value = 100
-                except:
-                    pass
+            elif self._position is not None:
+                new_position_value = min(100, self._position + deltatime*100/self._full_open_time)
+
         if oper_state == OPER_STATE_CLOSING:
-            if deltatime >= self._full_close_time*1000:
+            if deltatime >= self._full_close_time:
                 new_position_value = 0
-            else:
-                position_change = deltatime*100/(self._full_close_time*1000)
-                try:
-                    new_position_value = self._position - position_change
-                    if new_position_value < 0:
-                        new_position_value = 0
-                except:
-                    pass
+            elif self._position is not None:
+                new_position_value = max(0, self._position - deltatime*100/self._full_close_time)
 
         if update:
-            try:
-                self._position = new_position_value
-                self._tilt_value = new_tilt_value
-            except:
-                pass
+            self._position = new_position_value
+            self._tilt_value = new_tilt_value
 
         return (new_position_value, new_tilt_value)
 
+    def _dump_state(self):
+        """Return the estimated position and tilt to store."""
+        # While moving, store where the cover is now
+        position, tilt = self._get_position_and_tilt(
+            self._oper_state, self._time_last_movement_start, self.hass.loop.time()
+        )
+        if position is None and tilt is None:
+            return None
+        return {"position": position, "tilt": tilt}
+
     def _cancel_any_pending_stop_cover_timers(self):
         """Cancel any pending updates to stop movement of blinds."""
+        self._pending_run_time = None
+        self._device_timed = False
         if self._stop_cover_timer:
             _LOGGER.debug("%s: canceled pending stop timer", self.entity_id)
             self._stop_cover_timer()
             self._stop_cover_timer = None
 
 
-    def _output_update_callback(self):
-        """Output signal state from neuron has changed"""
-        motor_driver_up_state = self._unipi_hub.evok_state_get(self._device, self._port_up) == 1
-        motor_driver_down_state = self._unipi_hub.evok_state_get(self._device, self._port_down) == 1
+    def _port_up_update_callback(self, value):
+        """Up motor driver output has changed"""
+        self._motor_driver_up_state = value == 1
+        self._output_update_callback(self._unipi_hub.estimated_change_time())
+
+    def _port_down_update_callback(self, value):
+        """Down motor driver output has changed"""
+        self._motor_driver_down_state = value == 1
+        self._output_update_callback(self._unipi_hub.estimated_change_time())
+
+    def _output_update_callback(self, changed_at=None):
+        """Output signal state from neuron has changed
+
+        changed_at is the estimated loop.time() at which the relay flipped.
+        """
+        if changed_at is None:
+            changed_at = self.hass.loop.time()
+        motor_driver_up_state = self._motor_driver_up_state
+        motor_driver_down_state = self._motor_driver_down_state
         if not motor_driver_up_state and not motor_driver_down_state:
             new_oper_state = OPER_STATE_IDLE
         elif not motor_driver_up_state and motor_driver_down_state:
@@ -577,8 +698,7 @@ class UnipiCover(CoverEntity):
         else:
             new_oper_state = OPER_STATE_ERROR
             _LOGGER.error(
-                        "Detected signals on both motor drivers for",
-                        friendly_property_name,
+                        "Detected signals on both motor drivers for %s",
                         self._name,
                     )
         _LOGGER.info("Cover oper state %s", self._oper_state)
@@ -586,16 +706,31 @@ class UnipiCover(CoverEntity):
         if new_oper_state != self._oper_state:
             if new_oper_state == OPER_STATE_IDLE:
                  #update position and tilt
-                self._get_position_and_tilt(self._oper_state, self._time_last_movement_start, datetime.now(), True)
+                self._get_position_and_tilt(self._oper_state, self._time_last_movement_start, changed_at, True)
                 # clear start time
-                self._time_last_movement_start = 0
+                self._time_last_movement_start = None
+                self._restore_store.async_schedule_save()
+                if self._device_timed:
+                    self._device_timed_move_done()
 
             self._oper_state = new_oper_state
 
             #start timer for either closing on opening
             if self._oper_state in (OPER_STATE_OPENING, OPER_STATE_CLOSING):
-                self._time_last_movement_start = datetime.now()
-
-            self.schedule_update_ha_state()
+                self._time_last_movement_start = changed_at
+                if self._pending_run_time is not None:
+                    if self._device_timed:
+                        #only a backup, the device stops the motor itself
+                        stop_at = changed_at + self._pending_run_time + DEVICE_TIMER_BACKUP
+                    else:
+                        #the stop command needs about half a round trip to reach
+                        #the relay, so send it that much earlier
+                        stop_at = changed_at + self._pending_run_time - self._unipi_hub.command_latency / 2
+                    self._pending_run_time = None
+                    if self._stop_cover_timer:
+                        self._stop_cover_timer()
+                    self._stop_cover_timer = self._scheduler.async_schedule_at(stop_at, self._stop_cover_timeout)
+
+            self._unipi_hub.async_schedule_write(self)
 
 
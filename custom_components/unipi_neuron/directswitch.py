@@ -0,0 +1,135 @@
+"""DirectSwitch rules of the digital inputs of a Unipi Neuron."""
+import logging
+
+import voluptuous as vol
+
+from homeassistant.core import callback
+import homeassistant.helpers.config_validation as cv
+
+from .const import CIRCUIT_REGEX
+
+_LOGGER = logging.getLogger(__name__)
+
+CONF_DIRECT_SWITCH = "direct_switch"
+CONF_INPUT_DEVICE = "input_device"
+CONF_INPUT = "input"
+CONF_OUTPUT_DEVICE = "output_device"
+CONF_OUTPUT = "output"
+CONF_ACTION = "action"
+
+SERVICE_APPLY_DIRECT_SWITCH = "apply_direct_switch"
+
+MODE_DIRECT_SWITCH = "DirectSwitch"
+
+# Rule action -> EVOK ds_mode of the input
+DS_MODES = {
+    "follow": "Simple",
+    "invert": "Inverted",
+    "toggle": "Toggle",
+}
+
+# Output devices an input device can drive, by EVOK version
+OUTPUT_DEVICES = {
+    "input": ("relay",),
+    "di": ("ro", "do"),
+}
+
+
+def _validate_rule(rule):
+    """Reject rules the Neuron hardware cannot execute."""
+    outputs = OUTPUT_DEVICES[rule[CONF_INPUT_DEVICE]]
+    rule.setdefault(CONF_OUTPUT_DEVICE, outputs[0])
+    if rule[CONF_OUTPUT_DEVICE] not in outputs:
+        raise vol.Invalid(
+            f"{rule[CONF_INPUT_DEVICE]} inputs can only drive {', '.join(outputs)} outputs"
+        )
+    # DirectSwitch is wired to the output with the same group and number
+    if rule[CONF_OUTPUT] != rule[CONF_INPUT]:
+        raise vol.Invalid(
+            f"input {rule[CONF_INPUT]} can only drive output {rule[CONF_INPUT]},"
+            f" not {rule[CONF_OUTPUT]}"
+        )
+    return rule
+
+
+def _unique_inputs(rules):
+    inputs = [rule[CONF_INPUT] for rule in rules]
+    if len(inputs) != len(set(inputs)):
+        raise vol.Invalid("only one DirectSwitch rule per input")
+    return rules
+
+
+RULE_SCHEMA = vol.All(
+    vol.Schema(
+        {
+            vol.Optional(CONF_INPUT_DEVICE, default="input"): vol.In(OUTPUT_DEVICES),
+            vol.Required(CONF_INPUT): cv.matches_regex(CIRCUIT_REGEX),
+            vol.Optional(CONF_OUTPUT_DEVICE): vol.Any("relay", "ro", "do"),
+            vol.Required(CONF_OUTPUT): cv.matches_regex(CIRCUIT_REGEX),
+            vol.Required(CONF_ACTION): vol.In(DS_MODES),
+        }
+    ),
+    _validate_rule,
+)
+
+DIRECT_SWITCH_SCHEMA = vol.All(cv.ensure_list, [RULE_SCHEMA], _unique_inputs)
+
+
+class UnipiDirectSwitch:
+    """Compare the DirectSwitch configuration of a Neuron with declared rules.
+
+    With DirectSwitch an input switches its output on the Neuron itself,
+    independently of Home Assistant. The configuration the device reports
+    is checked after every full state sync and whenever it changes; rules
+    it does not match are kept in drift until they are applied.
+    """
+
+    def __init__(self, hub, rules):
+        """Initialize the rules of hub."""
+        self._hub = hub
+        self.rules = rules
+        # Inputs whose configuration differs from their rule
+        self.drift = []
+
+    @callback
+    def async_check(self):
+        """Update drift from the configuration reported by the device."""
+        drift = []
+        for rule in self.rules:
+            reported = self._hub.evok_direct_switch_get(rule[CONF_INPUT_DEVICE], rule[CONF_INPUT])
+            if reported != (MODE_DIRECT_SWITCH, DS_MODES[rule[CONF_ACTION]]):
+                drift.append(rule[CONF_INPUT])
+        if drift == self.drift:
+            return
+        # Drift that shrinks is a rule being applied
+        if any(circuit not in self.drift for circuit in drift):
+            _LOGGER.warning(
+                "DirectSwitch configuration of %s differs from the rules for inputs %s",
+                self._hub._name,
+                ", ".join(drift),
+            )
+        elif not drift:
+            _LOGGER.info("DirectSwitch configuration of %s matches the rules", self._hub._name)
+        self.drift = drift
+
+    async def async_apply(self):
+        """Write the rules the device configuration does not match."""
+        for rule in self.rules:
+            if rule[CONF_INPUT] not in self.drift:
+                continue
+            _LOGGER.info(
+                "Setting %s %s of %s to %s %s",
+                rule[CONF_INPUT_DEVICE],
+                rule[CONF_INPUT],
+                self._hub._name,
+                rule[CONF_ACTION],
+                rule[CONF_OUTPUT],
+            )
+            # The device reports the new configuration back, which
+            # clears the drift
+            await self._hub.evok_send(
+                rule[CONF_INPUT_DEVICE],
+                rule[CONF_INPUT],
+                {"mode": MODE_DIRECT_SWITCH, "ds_mode": DS_MODES[rule[CONF_ACTION]]},
+                force=True,
+            )
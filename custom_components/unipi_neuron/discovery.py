@@ -0,0 +1,100 @@
+"""Discovery of the circuits of Unipi Neurons with a persisted inventory."""
+import logging
+
+from homeassistant.core import callback
+from homeassistant.helpers.discovery import async_load_platform
+from homeassistant.helpers.start import async_at_started
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+INVENTORY_STORAGE_KEY = f"{DOMAIN}.inventory"
+INVENTORY_STORAGE_VERSION = 1
+INVENTORY_SAVE_DELAY = 10
+
+# EVOK device -> platform of the entities discovered for its circuits.
+# Both EVOK v2 ("relay", "input") and v3 ("ro", "di") names are kept
+# as reported, so the entities match what the device expects.
+DISCOVERY_PLATFORMS = {
+    "relay": "light",
+    "ro": "light",
+    "do": "light",
+    "led": "light",
+    "input": "binary_sensor",
+    "di": "binary_sensor",
+}
+
+
+class UnipiDiscovery:
+    """Offer entities for the circuits that are not configured in YAML.
+
+    The circuits reported by the last full state sync of every device are
+    stored, so on the next start the entities are created right away
+    instead of waiting for the devices to be reachable.
+    """
+
+    def __init__(self, hass, config, hubs):
+        """Initialize discovery for the hubs."""
+        self._hass = hass
+        self._config = config
+        self._hubs = hubs
+        self._store = Store(hass, INVENTORY_STORAGE_VERSION, INVENTORY_STORAGE_KEY)
+        # device name -> [[evok device, circuit]]
+        self._inventory = {}
+        # device name -> (evok device, circuit) already offered
+        self._offered = {hub._name: set() for hub in hubs}
+        self._started = False
+
+    async def async_setup(self):
+        """Load the inventory and offer its circuits once HA has started."""
+        self._inventory = await self._store.async_load() or {}
+        for hub in self._hubs:
+            hub.async_add_sync_listener(lambda hub=hub: self._async_device_synced(hub))
+        # By then every YAML platform has claimed its circuits
+        async_at_started(self._hass, self._async_started)
+
+    @callback
+    def _async_started(self, hass):
+        self._started = True
+        for hub in self._hubs:
+            circuits = [tuple(circuit) for circuit in self._inventory.get(hub._name, [])]
+            self._async_offer(hub, circuits)
+
+    @callback
+    def _async_device_synced(self, hub):
+        circuits = sorted(
+            circuit for circuit in hub.evok_circuits() if circuit[0] in DISCOVERY_PLATFORMS
+        )
+        if [list(circuit) for circuit in circuits] != self._inventory.get(hub._name):
+            _LOGGER.info("Inventory of %s: %d circuits", hub._name, len(circuits))
+            self._inventory[hub._name] = [list(circuit) for circuit in circuits]
+            self._store.async_delay_save(lambda: self._inventory, INVENTORY_SAVE_DELAY)
+        if self._started:
+            self._async_offer(hub, circuits)
+
+    @callback
+    def _async_offer(self, hub, circuits):
+        """Load the platforms with the circuits not offered nor configured yet."""
+        offered = self._offered[hub._name]
+        platforms = {}
+        for circuit in circuits:
+            if circuit in offered or circuit in hub.claimed:
+                continue
+            offered.add(circuit)
+            platforms.setdefault(DISCOVERY_PLATFORMS[circuit[0]], []).append(list(circuit))
+
+        for platform, platform_circuits in platforms.items():
+            _LOGGER.info(
+                "Discovered %d %s circuits on %s", len(platform_circuits), platform, hub._name
+            )
+            self._hass.async_create_task(
+                async_load_platform(
+                    self._hass,
+                    platform,
+                    DOMAIN,
+                    {"device_id": hub._name, "circuits": platform_circuits},
+                    self._config,
+                )
+            )
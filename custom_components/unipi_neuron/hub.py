@@ -0,0 +1,863 @@
+"""Connection hub for a single Unipi Neuron device."""
+import asyncio
+from collections import Counter, deque
+import itertools
+import json
+import logging
+
+import aiohttp
+
+from homeassistant.core import callback
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+
+from .const import EVOK_FILTER_DEVICES
+from .metrics import NeuronMetrics
+from .worker import UnipiEvokReader
+
+_LOGGER = logging.getLogger(__name__)
+
+# Time to wait for the device to echo back a written value
+ACK_TIMEOUT = 2
+
+# Interval of the event loop lag probe
+LOOP_LAG_PROBE_INTERVAL = 1
+
+# Weight of a new sample in the moving average of the command latency
+COMMAND_LATENCY_WEIGHT = 0.2
+
+COMMAND_CONNECT_TIMEOUT = 10
+
+# Heartbeat of the event connection: a ping every interval seconds, the
+# connection is dropped after this many unanswered pings in a row
+DEFAULT_HEARTBEAT_INTERVAL = 2
+DEFAULT_HEARTBEAT_MISSES = 3
+
+# Priority classes of outbound commands, highest first
+PRIORITY_SAFETY = 0  # cover stops and interlocks
+PRIORITY_USER = 1  # commands issued by users and automations
+PRIORITY_BULK = 2  # ramps and other high volume traffic
+
+# Commands that may wait to be sent; safety commands are always accepted
+MAX_QUEUED_COMMANDS = 256
+
+# Bulk commands sent per burst, so higher classes never wait long
+BULK_BURST = 32
+
+
+class UnipiNeuronHub:
+    """Owns the EVOK websocket client and the command writer of one Neuron."""
+
+    def __init__(self, hass, ip_address, neuron_type, name):
+        """Initialize the hub."""
+        self._hass = hass
+        self._name = name
+        self._ip_address = ip_address
+        self._neuron_type = neuron_type
+        # Created on first connect, so the websocket library is only
+        # imported once it is needed
+        self._client = None
+        # Event connection served by the I/O worker thread instead
+        self._reader = None
+        self._connection_task = None
+        # Optional second websocket only used to send commands, so they do
+        # not queue behind inbound traffic on the event connection
+        self._command_ws = None
+        self._command_task = None
+        self._started_at = None
+        # Set once the state of the device is known
+        self.ready = asyncio.Event()
+        # One queue per priority class of [sequence, device, circuit,
+        # value, futures, priority] entries; superseded entries get their
+        # futures set to None and are skipped
+        self._queues = tuple(deque() for _ in (PRIORITY_SAFETY, PRIORITY_USER, PRIORITY_BULK))
+        # (device, circuit) -> its queued entry
+        self._queued = {}
+        self._queue_event = asyncio.Event()
+        self._sequence = itertools.count()
+        self._pending_acks = {}
+        self._writer_task = None
+        # (device, circuit) -> [update callbacks] of the entities on this device
+        self._listeners = {}
+        # Called after every full state sync
+        self._sync_listeners = []
+        # (device, circuit) of the circuits configured in YAML
+        self.claimed = set()
+        # Entities whose availability follows the connection
+        self._entities = set()
+        self._available = False
+        # (device, circuit) -> last value reported by the device
+        self._state = {}
+        # (device, circuit) -> last pulse counter of a digital input
+        self._counters = {}
+        # (device, circuit) -> (mode, ds_mode) reported for a digital input
+        self._direct_switch_modes = {}
+        # Optional DirectSwitch rules of the inputs
+        self.direct_switch = None
+        # Reflex rules triggered by the inputs of this device
+        self.reflexes = None
+        # EVOK devices whose changes are pushed to us
+        self._filter_devices = list(EVOK_FILTER_DEVICES)
+        # Optional Modbus TCP transport for the digital I/O
+        self.modbus = None
+        self._modbus_task = None
+        # (device, circuit) -> number of writes queued but not yet resolved
+        self._inflight = Counter()
+        # True once the cached state has been confirmed by a full state
+        # sync on the current connection
+        self._synced = False
+        self._connected_once = False
+        self._disconnected_at = None
+        self._snapshot_changes = 0
+        self.reconnect_count = 0
+        self.last_resync_time = None
+        self.last_resync_changes = None
+        self.metrics = NeuronMetrics()
+        self._lag_probe = None
+        # Moving average of the command round trip in seconds
+        self.command_latency = 0.0
+        # loop.time() at which the message being dispatched was read
+        self.last_received_at = None
+        # Entities with a state write pending in this loop iteration
+        self._dirty = {}
+        self._flush_handle = None
+        # loop.time() reads of the messages waiting for that write
+        self._flush_received_at = []
+
+    @property
+    def queue_depth(self):
+        """Return the number of commands waiting to be written."""
+        return len(self._queued)
+
+    @property
+    def pending_confirmations(self):
+        """Return the number of written commands not yet confirmed."""
+        return sum(len(pending) for pending in self._pending_acks.values())
+
+    @property
+    def available(self):
+        """Return True while the device is connected and its state known."""
+        return self._available
+
+    @property
+    def synced(self):
+        """Return True when the state cache is confirmed by the device."""
+        return self._synced
+
+    @callback
+    def async_start(self, connection, command_connection=None):
+        """Start the writer and the connection tasks of this device."""
+        self._started_at = self._hass.loop.time()
+        self.async_start_writer()
+        self._schedule_lag_probe()
+        self._connection_task = self._hass.async_create_background_task(
+            connection, f"{self._name} EVOK connection"
+        )
+        if command_connection is not None:
+            self._command_task = self._hass.async_create_background_task(
+                command_connection, f"{self._name} EVOK command connection"
+            )
+        if self.modbus is not None:
+            self._modbus_task = self._hass.async_create_background_task(
+                self.modbus.async_run(), f"{self._name} Modbus connection"
+            )
+
+    @callback
+    def async_set_modbus(self, transport):
+        """Read and write the circuits in the layout of transport through Modbus.
+
+        Their devices are no longer subscribed to on the websocket.
+        """
+        self.modbus = transport
+        self._filter_devices = [
+            device for device in self._filter_devices if device not in transport.layout.devices
+        ]
+
+    @callback
+    def async_set_io_worker(self, worker):
+        """Receive and decode the event connection on the I/O worker thread."""
+        self._reader = UnipiEvokReader(worker, self, self._ip_address, self._neuron_type)
+
+    @callback
+    def async_set_direct_switch(self, direct_switch):
+        """Check the DirectSwitch configuration of the device against direct_switch."""
+        self.direct_switch = direct_switch
+
+    @callback
+    def async_set_reflexes(self, reflexes):
+        """Run reflexes for the changes received from the device."""
+        self.reflexes = reflexes
+
+    async def async_stop(self):
+        """Stop all tasks of this device and close the connection."""
+        tasks = (self._connection_task, self._command_task, self._writer_task, self._modbus_task)
+        for task in tasks:
+            if task is not None:
+                task.cancel()
+        self._connection_task = self._command_task = None
+        self._writer_task = self._modbus_task = None
+        await self.evok_command_close()
+        if self.modbus is not None:
+            await self.modbus.async_stop()
+        if self._lag_probe is not None:
+            self._lag_probe.cancel()
+            self._lag_probe = None
+        await self.evok_close()
+
+    @callback
+    def _schedule_lag_probe(self):
+        deadline = self._hass.loop.time() + LOOP_LAG_PROBE_INTERVAL
+        self._lag_probe = self._hass.loop.call_at(deadline, self._lag_probe_fired, deadline)
+
+    @callback
+    def _lag_probe_fired(self, deadline):
+        """Measure how late the event loop ran the probe."""
+        self.metrics.observe_loop_lag(self._hass.loop.time() - deadline)
+        self._schedule_lag_probe()
+
+    async def evok_connect(self):
+        self._synced = False
+        self._snapshot_changes = 0
+        if self._reader is not None:
+            if not await self._reader.async_connect():
+                return False
+        else:
+            if self._client is None:
+                from evok_ws_client import UnipiEvokWsClient
+
+                self._client = UnipiEvokWsClient(self._ip_address, self._neuron_type, self._name)
+            if not await self._client.evok_connect():
+                return False
+        if self._connected_once:
+            self.reconnect_count += 1
+        self._connected_once = True
+        return True
+
+    async def evok_close(self):
+        self._mark_disconnected()
+        if self._reader is not None:
+            await self._reader.async_close()
+            return True
+        ws = self._client._ws if self._client is not None else None
+        if ws is None:
+            return True
+        # Close the socket ourselves, so a half-dead connection is not
+        # left behind on every reconnect
+        self._client._ws = None
+        try:
+            await ws.close()
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.warning("Unable to close connection to %s", self._name)
+            return False
+        return True
+
+    async def evok_heartbeat(self, interval, max_misses):
+        """Ping the device every interval seconds over the event connection.
+
+        Returns when max_misses pings in a row were not answered within
+        interval, after aborting the connection, so the receive loop ends
+        right away instead of when TCP gives up.
+        """
+        if self._reader is not None:
+            ping, abort = self._reader.async_ping, self._reader.abort
+        else:
+            ws = self._client._ws
+            ping, abort = lambda: _ping(ws), ws.transport.abort
+        loop = self._hass.loop
+        misses = 0
+        while misses < max_misses:
+            sent_at = loop.time()
+            try:
+                await asyncio.wait_for(ping(), interval)
+            except asyncio.TimeoutError:
+                # The ping timed out after interval, send the next at once
+                misses += 1
+                _LOGGER.debug("Heartbeat %d of %s missed", misses, self._name)
+            except Exception:  # pylint: disable=broad-except
+                # Closed; the receive loop handles that
+                return
+            else:
+                misses = 0
+                await asyncio.sleep(sent_at + interval - loop.time())
+        _LOGGER.warning(
+            "No heartbeat from %s for %.1f s, reconnecting", self._name, interval * max_misses
+        )
+        self._mark_disconnected()
+        abort()
+
+    async def evok_command_connect(self, heartbeat=None):
+        """Open the command connection on the shared aiohttp session."""
+        session = async_get_clientsession(self._hass)
+        try:
+            ws = await asyncio.wait_for(
+                session.ws_connect(f"ws://{self._ip_address}/ws", heartbeat=heartbeat),
+                COMMAND_CONNECT_TIMEOUT,
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            _LOGGER.warning("Command connection to %s failed: %s", self._name, err)
+            return False
+        # Subscribe to a device without I/O, so EVOK pushes no events here
+        try:
+            await ws.send_str(json.dumps({"cmd": "filter", "devices": ["neuron"]}))
+        except (aiohttp.ClientError, ConnectionError) as err:
+            _LOGGER.warning("Command connection to %s failed: %s", self._name, err)
+            await ws.close()
+            return False
+        self._command_ws = ws
+        _LOGGER.debug("Command connection to %s open", self._name)
+        return True
+
+    async def evok_command_receive(self):
+        """Drain the command connection; returns False when it was lost."""
+        message = await self._command_ws.receive()
+        if message.type in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+            return True
+        _LOGGER.warning("Command connection to %s lost", self._name)
+        return False
+
+    async def evok_command_close(self):
+        ws, self._command_ws = self._command_ws, None
+        if ws is not None:
+            await ws.close()
+
+    async def evok_receive(self):
+        """Receive one message and dispatch the circuits that changed.
+
+        With the I/O worker, all changes received since the last call are
+        dispatched. Returns False when the connection was lost.
+        """
+        if self._reader is not None:
+            for batch in await self._reader.async_receive():
+                if batch is None:
+                    self._mark_disconnected()
+                    return False
+                self._async_handle_changes(*batch)
+            return True
+        try:
+            message = await self._client.evok_receive(False)
+        except Exception as err:  # pylint: disable=broad-except
+            _LOGGER.warning("Receiving from %s failed: %s", self._name, err)
+            message = False
+        if message is False:
+            self._mark_disconnected()
+            return False
+        self._async_handle_message(message, self._hass.loop.time(), True)
+        return True
+
+    @callback
+    def async_process_modbus(self, sections, received_at):
+        """Handle the circuits read through Modbus like a websocket message."""
+        self._async_handle_message(sections, received_at, False)
+
+    @callback
+    def _async_handle_message(self, message, received_at, websocket):
+        self.last_received_at = received_at
+        self.metrics.messages_received += 1
+        if self._async_process_message(message, websocket):
+            if self._flush_handle is not None:
+                self._flush_received_at.append(received_at)
+            else:
+                self.metrics.dispatch_latency.observe(self._hass.loop.time() - received_at)
+
+    @callback
+    def _async_handle_changes(self, changes, snapshot, received_at, messages):
+        """Handle a batch of changes decoded by the I/O worker."""
+        self.last_received_at = received_at
+        self.metrics.messages_received += messages
+        dispatched = False
+        for device, circuit, value, counter, direct_switch in changes:
+            dispatched |= self._async_apply(device, circuit, value, counter, direct_switch)
+        if snapshot and not self._synced:
+            self._async_synced()
+        if dispatched:
+            if self._flush_handle is not None:
+                self._flush_received_at.append(received_at)
+            else:
+                self.metrics.dispatch_latency.observe(self._hass.loop.time() - received_at)
+
+    @callback
+    def estimated_change_time(self):
+        """Estimate when the device changed the circuit being dispatched.
+
+        The update took about half a command round trip to reach us.
+        """
+        if self.last_received_at is None:
+            return self._hass.loop.time()
+        return self.last_received_at - self.command_latency / 2
+
+    @callback
+    def _mark_disconnected(self):
+        self._synced = False
+        self._async_set_available(False)
+        if self._connected_once and self._disconnected_at is None:
+            self._disconnected_at = self._hass.loop.time()
+
+    async def evok_register_filter(self):
+        """Subscribe to the changes of the devices in the filter."""
+        await self._send_over_event_ws(
+            json.dumps({"cmd": "filter", "devices": self._filter_devices})
+        )
+
+    @callback
+    def async_add_filter_devices(self, devices):
+        """Also subscribe to the changes of devices, e.g. "ai" or "temp"."""
+        added = [device for device in devices if device not in self._filter_devices]
+        if not added:
+            return
+        self._filter_devices.extend(added)
+        if self._event_connected():
+            # Otherwise the filter is registered on connect
+            self._hass.async_create_task(self.evok_register_filter())
+
+    async def evok_onewire_scan(self):
+        """Ask EVOK to scan the 1-Wire bus for new sensors."""
+        _LOGGER.info("Scanning 1-Wire bus of %s", self._name)
+        await self._send_over_ws(
+            json.dumps(
+                {"cmd": "set", "dev": "owbus", "circuit": "1", "value": {"do_scan": True}}
+            )
+        )
+
+    async def evok_full_state_sync(self):
+        await self._send_over_event_ws(json.dumps({"cmd": "all"}))
+
+    def evok_state_get(self, device, circuit, default="0"):
+        return self._state.get((device, circuit), default)
+
+    def evok_direct_switch_get(self, device, circuit):
+        """Return the (mode, ds_mode) reported for an input, or None."""
+        return self._direct_switch_modes.get((device, circuit))
+
+    def evok_counter_get(self, device, circuit):
+        """Return the last pulse counter of a digital input, or None."""
+        return self._counters.get((device, circuit))
+
+    async def evok_send(self, device, circuit, value, force=False, priority=PRIORITY_USER):
+        """Queue a write and wait until the device confirms it.
+
+        A write of the value the device already confirmed is skipped unless
+        force is set. Returns True when the new value was echoed back by
+        EVOK and False when the confirmation did not arrive within
+        ACK_TIMEOUT, or the write was dropped from a full queue.
+        """
+        key = (device, circuit)
+        if (
+            not force
+            and self._synced
+            and not self._inflight[key]
+            and key in self._state
+            and self._state[key] == _expected_value(value)
+        ):
+            _LOGGER.debug("Skipping write of unchanged %s %s", device, circuit)
+            return True
+
+        return await self.async_queue_write(device, circuit, value, priority)
+
+    @callback
+    def async_queue_write(self, device, circuit, value, priority=PRIORITY_USER):
+        """Queue a write without waiting for it.
+
+        Returns the future evok_send would wait for.
+        """
+        key = (device, circuit)
+        future = self._hass.loop.create_future()
+        self._inflight[key] += 1
+        future.add_done_callback(lambda _: self._write_done(key))
+        self._async_enqueue(device, circuit, value, future, priority)
+        return future
+
+    @callback
+    def _async_enqueue(self, device, circuit, value, future, priority):
+        """Queue a write; it replaces a write to the circuit still queued."""
+        key = (device, circuit)
+        futures = [future]
+        superseded = self._queued.pop(key, None)
+        if superseded is not None:
+            # Only the last value has to reach the device, as soon as the
+            # most urgent of the writes asks for
+            futures = superseded[4] + futures
+            priority = min(priority, superseded[5])
+            superseded[4] = None
+
+        if len(self._queued) >= MAX_QUEUED_COMMANDS and priority != PRIORITY_SAFETY:
+            if not self._async_drop_oldest(PRIORITY_BULK) and (
+                priority == PRIORITY_BULK or not self._async_drop_oldest(PRIORITY_USER)
+            ):
+                _LOGGER.warning("Send queue of %s full, dropping %s %s", self._name, device, circuit)
+                _resolve(futures, False)
+                return
+
+        entry = [next(self._sequence), device, circuit, value, futures, priority]
+        self._queues[priority].append(entry)
+        self._queued[key] = entry
+        self._queue_event.set()
+
+    @callback
+    def _async_drop_oldest(self, priority):
+        """Drop the oldest queued write of a class; False if there is none."""
+        queue = self._queues[priority]
+        while queue:
+            entry = queue.popleft()
+            if entry[4] is None:
+                continue
+            _LOGGER.warning("Send queue of %s full, dropping %s %s", self._name, entry[1], entry[2])
+            del self._queued[(entry[1], entry[2])]
+            _resolve(entry[4], False)
+            return True
+        return False
+
+    @callback
+    def _async_take_burst(self):
+        """Take the queued writes to send next, most urgent first."""
+        burst = []
+        for priority, queue in enumerate(self._queues):
+            limit = BULK_BURST if priority == PRIORITY_BULK else None
+            taken = 0
+            while queue and (limit is None or taken < limit):
+                entry = queue.popleft()
+                if entry[4] is None:
+                    continue
+                del self._queued[(entry[1], entry[2])]
+                burst.append((entry[1], entry[2], entry[3], entry[4]))
+                taken += 1
+        if not self._queued:
+            self._queue_event.clear()
+        return burst
+
+    @callback
+    def _write_done(self, key):
+        self._inflight[key] -= 1
+        if not self._inflight[key]:
+            del self._inflight[key]
+
+    @callback
+    def async_start_writer(self):
+        """Start the command writer task of this device."""
+        if self._writer_task is None:
+            self._writer_task = self._hass.loop.create_task(self._writer())
+
+    async def _writer(self):
+        """Send queued commands, one burst per loop iteration."""
+        while True:
+            await self._queue_event.wait()
+            # Let every command issued in the same loop tick get queued
+            await asyncio.sleep(0)
+            burst = self._async_take_burst()
+            if burst:
+                await self._send_batch(burst)
+
+    async def _send_batch(self, batch):
+        """Write a burst of [(device, circuit, value, futures)] in order.
+
+        Within a priority class the writes keep the order they were issued
+        in, so an interlock (e.g. cover port down to "0" before port up to
+        "1") is preserved.
+        """
+        ordered = [
+            ((device, circuit), (value, futures)) for device, circuit, value, futures in batch
+        ]
+
+        # Consecutive commands for the same transport are sent together
+        runs = []
+        for command in ordered:
+            (device, circuit), (value, _) = command
+            modbus = self.modbus is not None and self.modbus.can_write(device, circuit, value)
+            if runs and runs[-1][0] == modbus:
+                runs[-1][1].append(command)
+            else:
+                runs.append((modbus, [command]))
+
+        sent = []
+        sent_at = self._hass.loop.time()
+        try:
+            for modbus, commands in runs:
+                if modbus:
+                    await self.modbus.async_write([(key, value) for key, (value, _) in commands])
+                    sent.extend((key, value, futures) for key, (value, futures) in commands)
+                    continue
+                for (device, circuit), (value, futures) in commands:
+                    await self._send_over_ws(json.dumps(
+                        {"cmd": "set", "dev": device, "circuit": circuit, "value": value}
+                    ))
+                    sent.append(((device, circuit), value, futures))
+        except Exception as err:  # pylint: disable=broad-except
+            _LOGGER.warning("Sending to %s failed: %s", self._name, err)
+            for (_, (_, futures)) in ordered[len(sent):]:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(err)
+
+        _LOGGER.debug("Sent %d commands to %s", len(sent), self._name)
+        self.metrics.messages_sent += len(sent)
+        waiting = []
+        for key, value, futures in sent:
+            expected = _expected_value(value)
+            if expected is None or self._state.get(key) == expected:
+                # Nothing will be echoed back for this write
+                _resolve(futures, True)
+                continue
+            entry = (expected, futures, sent_at)
+            self._pending_acks.setdefault(key, []).append(entry)
+            waiting.append((key, entry))
+
+        if waiting:
+            self._hass.loop.call_later(ACK_TIMEOUT, self._ack_timeout, waiting)
+
+    async def _send_over_ws(self, frame):
+        """Send a command, on the command connection when it is up."""
+        command_ws = self._command_ws
+        if command_ws is not None and not command_ws.closed:
+            await command_ws.send_str(frame)
+            return
+        # Without a command connection commands share the event connection
+        await self._send_over_event_ws(frame)
+
+    async def _send_over_event_ws(self, frame):
+        if self._reader is not None:
+            # Written by the I/O worker, in order
+            self._reader.send(frame)
+            return
+        if not self._event_connected():
+            raise ConnectionError("not connected")
+        await self._client._evok_send_over_ws(frame)
+
+    def _event_connected(self):
+        if self._reader is not None:
+            return self._reader.connected
+        return self._client is not None and self._client._ws is not None
+
+    @callback
+    def _ack_timeout(self, waiting):
+        """Give up on confirmations that did not arrive in time."""
+        for key, entry in waiting:
+            pending = self._pending_acks.get(key)
+            if not pending or entry not in pending:
+                continue
+            pending.remove(entry)
+            if not pending:
+                del self._pending_acks[key]
+            _LOGGER.debug("No confirmation from %s for %s", self._name, key)
+            _resolve(entry[1], False)
+
+    @callback
+    def async_add_listener(self, device, circuit, update_callback):
+        """Call update_callback(value) when the circuit changes.
+
+        Returns a function that removes the listener again.
+        """
+        listeners = self._listeners.setdefault((device, circuit), [])
+        listeners.append(update_callback)
+
+        @callback
+        def remove_listener():
+            listeners.remove(update_callback)
+            if not listeners:
+                self._listeners.pop((device, circuit), None)
+
+        return remove_listener
+
+    @callback
+    def _async_process_message(self, message, websocket=True):
+        """Update the state cache and dispatch only the changed circuits.
+
+        Only websocket messages can complete a full state sync. Returns
+        True when a changed circuit had listeners.
+        """
+        if isinstance(message, dict):
+            message = [message]
+        snapshot = False
+        dispatched = False
+        for section in message:
+            try:
+                device = section["dev"]
+                circuit = section["circuit"]
+            except (KeyError, TypeError):
+                continue
+            if websocket and device not in self._filter_devices:
+                # Only the reply to a full state sync carries devices
+                # outside of the registered filter
+                snapshot = True
+            if "value" not in section:
+                continue
+            direct_switch = None
+            if "ds_mode" in section:
+                direct_switch = (section.get("mode"), section["ds_mode"])
+            dispatched |= self._async_apply(
+                device, circuit, section["value"], section.get("counter"), direct_switch
+            )
+
+        if snapshot and not self._synced:
+            self._async_synced()
+        return dispatched
+
+    @callback
+    def _async_apply(self, device, circuit, value, counter=None, direct_switch=None):
+        """Update the cached circuit and dispatch it if it changed."""
+        key = (device, circuit)
+        if counter is not None:
+            # Read by the pulse counter sensors at their own interval
+            self._counters[key] = counter
+        if direct_switch is not None and self._direct_switch_modes.get(key) != direct_switch:
+            self._direct_switch_modes[key] = direct_switch
+            if self.direct_switch is not None and self._synced:
+                self.direct_switch.async_check()
+        state = self._state
+        if key in state and state[key] == value:
+            return False
+        state[key] = value
+        self._snapshot_changes += 1
+        if self.reflexes is not None:
+            # Before the entities, so the outputs are queued first
+            self.reflexes.async_trigger(device, circuit, value)
+        return self.async_dispatch(device, circuit, value)
+
+    @callback
+    def async_add_entity(self, entity):
+        """Track entity, so it is written when the device availability changes."""
+        self._entities.add(entity)
+
+        @callback
+        def remove_entity():
+            self._entities.discard(entity)
+
+        return remove_entity
+
+    @callback
+    def _async_set_available(self, available):
+        """Update the availability of all entities of the device at once."""
+        if available == self._available:
+            return
+        self._available = available
+        _LOGGER.info("Neuron %s %s", self._name, "available" if available else "unavailable")
+        for entity in self._entities:
+            self.async_schedule_write(entity)
+
+    @callback
+    def async_claim(self, device, circuit):
+        """Mark a circuit as configured, so it is not offered by discovery."""
+        self.claimed.add((device, circuit))
+
+    @callback
+    def async_add_sync_listener(self, sync_callback):
+        """Call sync_callback() after every full state sync."""
+        self._sync_listeners.append(sync_callback)
+
+    def evok_circuits(self):
+        """Return the (device, circuit) of every circuit the device reported."""
+        return list(self._state)
+
+    @callback
+    def _async_synced(self):
+        """Handle the completion of a full state sync."""
+        self._synced = True
+        self._async_set_available(True)
+        if self.direct_switch is not None:
+            self.direct_switch.async_check()
+        for sync_callback in self._sync_listeners:
+            sync_callback()
+        if not self.ready.is_set():
+            self.ready.set()
+            _LOGGER.info(
+                "Neuron %s ready %.2f s after setup, %d circuits known",
+                self._name,
+                self._hass.loop.time() - self._started_at,
+                len(self._state),
+            )
+        if self._disconnected_at is None:
+            _LOGGER.debug("Full state of %s synchronized", self._name)
+            return
+        # Circuits that did not change while we were disconnected
+        # have been dropped on receive, so this was a delta resync
+        self.last_resync_time = self._hass.loop.time() - self._disconnected_at
+        self.last_resync_changes = self._snapshot_changes
+        self._disconnected_at = None
+        _LOGGER.info(
+            "Resynchronized %s after %.1f s (reconnect #%d): %d circuits changed",
+            self._name,
+            self.last_resync_time,
+            self.reconnect_count,
+            self.last_resync_changes,
+        )
+
+    @callback
+    def async_dispatch(self, device, circuit, value):
+        """Hand a changed circuit value to the entities listening to it.
+
+        Returns True when the circuit had listeners.
+        """
+        if self._pending_acks:
+            self.evok_confirm(device, circuit, value)
+        listeners = self._listeners.get((device, circuit))
+        if listeners is None:
+            return False
+        for update_callback in listeners:
+            update_callback(value)
+        return True
+
+    @callback
+    def async_schedule_write(self, entity):
+        """Write the state of entity once the current loop iteration is done.
+
+        All updates of an entity caused by one message or burst end in a
+        single async_write_ha_state.
+        """
+        self._dirty[entity] = None
+        if self._flush_handle is None:
+            self._flush_handle = self._hass.loop.call_soon(self._async_flush_writes)
+
+    @callback
+    def _async_flush_writes(self):
+        dirty, self._dirty = self._dirty, {}
+        self._flush_handle = None
+        for entity in dirty:
+            if entity.hass is None:
+                # Removed in the meantime
+                continue
+            entity.async_write_ha_state()
+        now = self._hass.loop.time()
+        for received_at in self._flush_received_at:
+            self.metrics.dispatch_latency.observe(now - received_at)
+        self._flush_received_at.clear()
+
+    @callback
+    def evok_confirm(self, device, circuit, value):
+        """Resolve writes confirmed by a state update from the device."""
+        pending = self._pending_acks.get((device, circuit))
+        if not pending:
+            return
+        remaining = []
+        now = self._hass.loop.time()
+        for entry in pending:
+            expected, futures, sent_at = entry
+            if expected == value:
+                rtt = now - sent_at
+                self.metrics.command_rtt.observe(rtt)
+                self.command_latency += COMMAND_LATENCY_WEIGHT * (rtt - self.command_latency)
+                _resolve(futures, True)
+            else:
+                remaining.append(entry)
+        if remaining:
+            self._pending_acks[(device, circuit)] = remaining
+        else:
+            del self._pending_acks[(device, circuit)]
+
+
+def _expected_value(value):
+    """Return the value EVOK will echo back for a write, if any."""
+    if isinstance(value, dict):
+        # Further fields of the set command, e.g. a relay timeout
+        value = value.get("value")
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return None
+
+
+async def _ping(ws):
+    """Send a websocket ping and wait for the pong."""
+    pong_waiter = await ws.ping()
+    await pong_waiter
+
+
+def _resolve(futures, result):
+    for future in futures:
+        if not future.done():
+            future.set_result(result)
@@ -3,9 +3,12 @@ import logging
 
 import voluptuous as vol
 
+from homeassistant.core import callback
+
 # Import the device class from the component that you want to support
 from homeassistant.components.light import (
     ATTR_BRIGHTNESS,
+    ATTR_TRANSITION,
     PLATFORM_SCHEMA,
     LightEntity,
     LightEntityFeature,
@@ -17,13 +20,16 @@ from homeassistant.const import (
     CONF_DEVICE_ID,
     CONF_DEVICES,
     CONF_NAME,
+    CONF_OPTIMISTIC,
     CONF_PORT,
     CONF_MODE
 )
 import homeassistant.helpers.config_validation as cv
-from homeassistant.helpers.dispatcher import async_dispatcher_connect
 
-from .const import DOMAIN
+from .const import CIRCUIT_REGEX, DOMAIN
+from .hub import PRIORITY_BULK
+from .ramp import async_get_ramp_engine
+from .restore import async_get_restore_store
 
 CONF_PWM_MODE = "pwm_mode"
 
@@ -34,8 +40,9 @@ DEVICE_SCHEMA = vol.Schema(
     {
         vol.Required(CONF_NAME): cv.string,
         vol.Required(CONF_DEVICE): vol.Any("relay", "led", "ro", "do"),
-        vol.Required(CONF_PORT): cv.matches_regex(r"^(?:UART_)?([1-9]|1[0-5])_([0-1]?[0-9])(_0[0-9])?$"),
+        vol.Required(CONF_PORT): cv.matches_regex(CIRCUIT_REGEX),
         vol.Required(CONF_MODE): vol.Any("on_off", "pwm"),
+        vol.Optional(CONF_OPTIMISTIC, default=False): cv.boolean,
     }
 )
 
@@ -49,10 +56,20 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
 
 async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
     """Set up the Unipi Lights."""
+    if discovery_info is not None:
+        # Circuits found by discovery that are not configured in YAML
+        unipi_hub = hass.data[DOMAIN][discovery_info[CONF_DEVICE_ID]]
+        async_add_entities(
+            UnipiLight(unipi_hub, f"{unipi_hub._name} {device} {port}", port, device, "on_off")
+            for device, port in discovery_info["circuits"]
+        )
+        return
+
     _LOGGER.info("Setup platform Unipi Neuron light on %s", config)
     unipi_device_name = config[CONF_DEVICE_ID]
     lights = []
     for light in config[CONF_DEVICES]:
+        hass.data[DOMAIN][unipi_device_name].async_claim(light[CONF_DEVICE], light[CONF_PORT])
         lights.append(
             UnipiLight(
                 hass.data[DOMAIN][unipi_device_name],
@@ -60,6 +77,7 @@ async def async_setup_platform(hass, config, async_add_entities, discovery_info=
                 light[CONF_PORT],
                 light[CONF_DEVICE],
                 light[CONF_MODE],
+                light[CONF_OPTIMISTIC],
             )
         )
 
@@ -70,18 +88,25 @@ async def async_setup_platform(hass, config, async_add_entities, discovery_info=
 class UnipiLight(LightEntity):
     """Representation of an Light attached to UniPi product relay or digital output."""
 
-    def __init__(self, unipi_hub, name, port, device, mode):
+    _attr_should_poll = False
+
+    def __init__(self, unipi_hub, name, port, device, mode, optimistic=False):
         """Initialize UniPi Light."""
         self._unipi_hub = unipi_hub
+        self._optimistic = optimistic
+        # Optimistic writes not confirmed or timed out yet
+        self._pending_writes = 0
         self._name = name
         self._port = port
         self._device = device
         self._state = None
         self._dimmable = False
         self._brightness = None
+        self._restore_store = None
         self._attr_supported_features = LightEntityFeature(0)
         if mode == "pwm":
             self._dimmable = True
+            self._attr_supported_features = LightEntityFeature.TRANSITION
             self._attr_color_mode = ColorMode.BRIGHTNESS
             self._attr_supported_color_modes = {ColorMode.BRIGHTNESS}
         else:
@@ -90,9 +115,22 @@ class UnipiLight(LightEntity):
 
     async def async_added_to_hass(self):
         """Call when entity is added to hass."""
-        signal = f"{DOMAIN}_{self._unipi_hub._name}_{self._device}_{self._port}"
-        _LOGGER.debug("connecting %s", signal)
-        async_dispatcher_connect(self.hass, signal, self._update_callback)
+        _LOGGER.debug("connecting %s %s", self._device, self._port)
+        self.async_on_remove(
+            self._unipi_hub.async_add_listener(self._device, self._port, self._update_callback)
+        )
+        self.async_on_remove(self._unipi_hub.async_add_entity(self))
+        # Start from the cached state if the device already reported it
+        value = self._unipi_hub.evok_state_get(self._device, self._port, None)
+        if value is not None:
+            self._state = value == 1
+        if self._dimmable:
+            # The duty cycle is not reported, the Neuron kept the last one set
+            self._restore_store = async_get_restore_store(self.hass)
+            restored, remove = self._restore_store.async_restore(self.unique_id, self._dump_state)
+            self.async_on_remove(remove)
+            if restored is not None and self._brightness is None:
+                self._brightness = restored["brightness"]
 
     @property
     def name(self):
@@ -104,6 +142,11 @@ class UnipiLight(LightEntity):
         """Return the unique ID of this light entity."""
         return f"{self._device}_{self._port}_at_{self._unipi_hub._name}"
 
+    @property
+    def available(self):
+        """Return True while the Neuron is connected."""
+        return self._unipi_hub.available
+
     @property
     def brightness(self):
         """Return the brightness of the light.
@@ -115,8 +158,6 @@ class UnipiLight(LightEntity):
     @property
     def is_on(self):
         """Return true if light is on."""
-        _LOGGER.info("Get status of light %s", self._name)
-
         if self._dimmable:
             if self._brightness == 0:
                 return False
@@ -137,26 +178,124 @@ class UnipiLight(LightEntity):
 
         if self._dimmable:
             _LOGGER.info("Turn on light %s. Set britness to %d ", self._name, brightness)
-            #await self._unipi_hub.evok_send(self._device, self._port, str(round(brightness / 255 * 100)))
-            dict_to_send = {}
-            dict_to_send["pwm_duty"] = str(round(brightness / 255 * 100))
+            #a new command replaces a running transition
+            ramp_engine = async_get_ramp_engine(self.hass)
+            reached = ramp_engine.async_cancel(self)
+            transition = kwargs.get(ATTR_TRANSITION)
+            if transition:
+                #continue from where a running transition got to, not its target
+                if reached is None:
+                    reached = self._brightness or 0
+                ramp_engine.async_start(self, reached, brightness, transition)
+                self._brightness = brightness
+                self._restore_store.async_schedule_save()
+                self._unipi_hub.async_schedule_write(self)
+                return
+            previous = self._brightness
             self._brightness = brightness
-            await self._unipi_hub.evok_send(self._device, self._port, dict_to_send)
+            self._restore_store.async_schedule_save()
+            # The duty cycle is not echoed back by EVOK
+            self._unipi_hub.async_schedule_write(self)
+            await self._async_send(
+                {"pwm_duty": str(round(brightness / 255 * 100))}, previous
+            )
         else:
             _LOGGER.info("Turn on light %s", self._name)
-            await self._unipi_hub.evok_send(self._device, self._port, "1")
+            previous = self._state
+            if self._optimistic:
+                self._state = True
+            await self._async_send("1", previous)
 
     async def async_turn_off(self, **kwargs):
         """Instruct the light to turn off."""
         if self._dimmable:
             _LOGGER.info("Turn off light %s. Set britness to %d ", self._name, 0)
-            dict_to_send = {}
-            dict_to_send["pwm_duty"] = "0"
-            await self._unipi_hub.evok_send(self._device, self._port, dict_to_send)
+            ramp_engine = async_get_ramp_engine(self.hass)
+            reached = ramp_engine.async_cancel(self)
+            transition = kwargs.get(ATTR_TRANSITION)
+            if transition:
+                #continue from where a running transition got to, not its target
+                if reached is None:
+                    reached = self._brightness or 0
+                ramp_engine.async_start(self, reached, 0, transition)
+                self._brightness = 0
+                self._restore_store.async_schedule_save()
+                self._unipi_hub.async_schedule_write(self)
+                return
+            previous = self._brightness
             self._brightness = 0
+            self._restore_store.async_schedule_save()
+            self._unipi_hub.async_schedule_write(self)
+            await self._async_send({"pwm_duty": "0"}, previous)
         else:
             _LOGGER.info("Turn off light %s", self._name)
-            await self._unipi_hub.evok_send(self._device, self._port, "0")
+            previous = self._state
+            if self._optimistic:
+                self._state = False
+            await self._async_send("0", previous)
+
+    async def async_write_brightness(self, brightness):
+        """Write a ramp step (0-255) as PWM duty cycle to the output."""
+        dict_to_send = {}
+        dict_to_send["pwm_duty"] = str(round(brightness / 255 * 100))
+        await self._unipi_hub.evok_send(
+            self._device, self._port, dict_to_send, priority=PRIORITY_BULK
+        )
+
+    async def _async_send(self, value, previous):
+        """Send value to the output.
+
+        In optimistic mode the new state is written right away and checked
+        against the device once the write is confirmed or timed out.
+        """
+        if not self._optimistic:
+            await self._unipi_hub.evok_send(self._device, self._port, value)
+            return
+
+        self.async_write_ha_state()
+        self._pending_writes += 1
+        try:
+            confirmed = await self._unipi_hub.evok_send(self._device, self._port, value)
+        except Exception as err:  # pylint: disable=broad-except
+            _LOGGER.warning("Write to light %s failed: %s", self._name, err)
+            confirmed = None
+        finally:
+            self._pending_writes -= 1
+
+        if confirmed is False:
+            _LOGGER.warning("Light %s: no confirmation of %s from the device", self._name, value)
+        if not self._pending_writes:
+            self._async_reconcile(confirmed is None, previous)
+
+    @callback
+    def _async_reconcile(self, failed, previous):
+        """Correct the optimistic state from the state the device reported."""
+        if self._dimmable:
+            # The duty cycle is not echoed back, only a failed write is known
+            if failed and self._brightness != previous:
+                _LOGGER.warning(
+                    "Light %s: restoring brightness %s after failed write", self._name, previous
+                )
+                self._brightness = previous
+                self._restore_store.async_schedule_save()
+                self.async_write_ha_state()
+            return
+
+        value = self._unipi_hub.evok_state_get(self._device, self._port, None)
+        actual = previous if value is None else value == 1
+        if actual != self._state:
+            _LOGGER.warning(
+                "Light %s: device reports %s instead of optimistic state %s",
+                self._name, actual, self._state,
+            )
+            self._state = actual
+            self.async_write_ha_state()
+
+    def _dump_state(self):
+        """Return the brightness to store."""
+        if self._brightness is None:
+            return None
+        return {"brightness": self._brightness}
 
     # def async_update(self):
     #     """Fetch new state data for this light.
@@ -165,8 +304,12 @@ class UnipiLight(LightEntity):
     #     _LOGGER.info("Update light %s", self._name)
     #     self._state = self._unipi_hub.evok_state_get(self._device, self._port) == 1
 
-    def _update_callback(self):
+    @callback
+    def _update_callback(self, value):
         """State has changed"""
-        self._state = self._unipi_hub.evok_state_get(self._device, self._port) == 1
-        self.schedule_update_ha_state()
+        if self._pending_writes:
+            # Optimistic state is reconciled once the writes are settled
+            return
+        self._state = value == 1
+        self._unipi_hub.async_schedule_write(self)
 
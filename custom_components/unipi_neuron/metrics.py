@@ -0,0 +1,66 @@
+"""Lightweight performance counters of a Unipi Neuron connection."""
+from bisect import bisect_left
+
+# Upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5
+)
+
+
+class Histogram:
+    """Fixed-bucket histogram; observing a sample is a bisect and an add."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # The last bucket catches everything above the highest bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def snapshot(self):
+        return list(self.counts), self.total
+
+    def quantile(self, fraction, since=None):
+        """Return the bucket bound below which fraction of the samples are.
+
+        Only samples observed after the snapshot since are considered.
+        Returns None without samples.
+        """
+        counts = self.counts
+        if since is not None:
+            counts = [now - before for now, before in zip(counts, since[0])]
+        number = sum(counts)
+        if not number:
+            return None
+        rank = fraction * number
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                break
+        if index == len(self.buckets):
+            return self.buckets[-1]
+        return self.buckets[index]
+
+
+class NeuronMetrics:
+    """Counters of one Neuron connection, cheap enough to always be on."""
+
+    def __init__(self):
+        self.messages_received = 0
+        self.messages_sent = 0
+        # Socket read until the entity states have been written
+        self.dispatch_latency = Histogram()
+        # evok_send until EVOK echoed the new value
+        self.command_rtt = Histogram()
+        # Event loop lag measured by the receive loop probe
+        self.loop_lag = 0.0
+        self.loop_lag_max = 0.0
+
+    def observe_loop_lag(self, lag):
+        self.loop_lag = lag
+        if lag > self.loop_lag_max:
+            self.loop_lag_max = lag
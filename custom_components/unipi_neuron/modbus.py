@@ -0,0 +1,290 @@
+"""Modbus TCP transport for the digital I/O of a Unipi Neuron."""
+import asyncio
+import itertools
+import logging
+import struct
+
+from homeassistant.const import CONF_DEVICE
+from homeassistant.core import callback
+
+_LOGGER = logging.getLogger(__name__)
+
+CONF_MODBUS = "modbus"
+CONF_UNIT = "unit"
+CONF_REGISTERS = "registers"
+CONF_GROUP = "group"
+CONF_REGISTER = "register"
+CONF_COUNT = "count"
+CONF_COIL = "coil"
+
+DEFAULT_MODBUS_PORT = 502
+
+# EVOK devices whose circuits are written through Modbus
+OUTPUT_DEVICES = ("relay", "ro", "do", "led")
+
+READ_HOLDING_REGISTERS = 0x03
+WRITE_SINGLE_COIL = 0x05
+WRITE_MULTIPLE_COILS = 0x0F
+
+# Largest number of coils a single write may set
+MAX_WRITE_COILS = 1968
+
+# Largest number of registers a single read may return
+MAX_READ_REGISTERS = 125
+
+CONNECT_TIMEOUT = 5
+REQUEST_TIMEOUT = 2
+
+# Reconnect backoff in seconds
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30
+
+
+class ModbusError(Exception):
+    """The Neuron answered a request with a Modbus exception."""
+
+
+class UnipiModbusClient:
+    """Minimal asyncio Modbus TCP client for holding registers and coils.
+
+    Requests are pipelined: several may be in flight on the connection,
+    matched to their responses by transaction id.
+    """
+
+    def __init__(self, host, port, unit):
+        """Initialize the client."""
+        self._host = host
+        self._port = port
+        self._unit = unit
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._transactions = itertools.count(1)
+        # transaction id -> future of the response pdu
+        self._pending = {}
+
+    @property
+    def connected(self):
+        return self._writer is not None
+
+    async def async_connect(self):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self._host, self._port), CONNECT_TIMEOUT
+        )
+        self._reader_task = asyncio.get_running_loop().create_task(self._read_responses())
+
+    async def async_close(self):
+        writer, self._writer = self._writer, None
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        self._fail_pending(ConnectionError("connection closed"))
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def async_read_registers(self, address, count):
+        """Read count holding registers starting at address."""
+        pdu = await self._request(struct.pack(">BHH", READ_HOLDING_REGISTERS, address, count))
+        return list(struct.unpack(f">{count}H", pdu[2:2 + 2 * count]))
+
+    async def async_write_coils(self, address, values):
+        """Write consecutive coils starting at address to the booleans values."""
+        if len(values) == 1:
+            await self._request(
+                struct.pack(">BHH", WRITE_SINGLE_COIL, address, 0xFF00 if values[0] else 0)
+            )
+            return
+        packed = bytearray((len(values) + 7) // 8)
+        for index, value in enumerate(values):
+            if value:
+                packed[index // 8] |= 1 << index % 8
+        await self._request(
+            struct.pack(">BHHB", WRITE_MULTIPLE_COILS, address, len(values), len(packed))
+            + bytes(packed)
+        )
+
+    async def _request(self, pdu):
+        if self._writer is None:
+            raise ConnectionError("not connected")
+        transaction = next(self._transactions) & 0xFFFF
+        future = asyncio.get_running_loop().create_future()
+        self._pending[transaction] = future
+        self._writer.write(struct.pack(">HHHB", transaction, 0, len(pdu) + 1, self._unit) + pdu)
+        try:
+            return await asyncio.wait_for(future, REQUEST_TIMEOUT)
+        finally:
+            self._pending.pop(transaction, None)
+
+    async def _read_responses(self):
+        try:
+            while True:
+                header = await self._reader.readexactly(7)
+                transaction, _, length, _ = struct.unpack(">HHHB", header)
+                pdu = await self._reader.readexactly(length - 1)
+                future = self._pending.get(transaction)
+                if future is None or future.done():
+                    continue
+                if pdu[0] & 0x80:
+                    future.set_exception(ModbusError(f"exception code {pdu[1]}"))
+                else:
+                    future.set_result(pdu)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError) as err:
+            _LOGGER.debug("Modbus connection to %s lost: %s", self._host, err)
+        self._writer = None
+        self._fail_pending(ConnectionError("connection lost"))
+
+    def _fail_pending(self, err):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(err)
+
+
+class UnipiModbusLayout:
+    """Map EVOK circuits to bits of Neuron holding registers.
+
+    Each configured block is a bitmap of count circuits of one EVOK device
+    and group, starting at bit 0 of register; circuit group_NN is bit NN-1.
+    The circuits of a block with a coil are written as the coils starting
+    there; the registers are only read.
+    """
+
+    def __init__(self, blocks):
+        """Initialize the layout from the registers config."""
+        # register -> [(device, circuit, bit)]
+        self.bits = {}
+        # (device, circuit) -> (register, bit)
+        self.circuits = {}
+        # (device, circuit) -> coil address
+        self.coils = {}
+        self.devices = set()
+        for block in blocks:
+            device = block[CONF_DEVICE]
+            self.devices.add(device)
+            for index in range(block[CONF_COUNT]):
+                register = block[CONF_REGISTER] + index // 16
+                circuit = f"{block[CONF_GROUP]}_{index + 1:02d}"
+                self.bits.setdefault(register, []).append((device, circuit, index % 16))
+                self.circuits[(device, circuit)] = (register, index % 16)
+                if CONF_COIL in block:
+                    self.coils[(device, circuit)] = block[CONF_COIL] + index
+        self.spans = _spans(sorted(self.bits))
+
+    def decode(self, registers):
+        """Return EVOK style sections of the registers read."""
+        sections = []
+        for register, value in registers.items():
+            for device, circuit, bit in self.bits[register]:
+                sections.append({"dev": device, "circuit": circuit, "value": value >> bit & 1})
+        return sections
+
+
+class UnipiModbusTransport:
+    """Poll and write the digital I/O of a Neuron through Modbus TCP.
+
+    All configured registers are read as a few block reads per scan and
+    fed through the same state cache and dispatch path as websocket
+    messages. Output changes are written as coils, one write per run of
+    consecutive coils, so only the changed outputs are set and outputs
+    the Neuron switched since the last read are left alone.
+    """
+
+    def __init__(self, hub, host, port, unit, layout, scan_interval):
+        """Initialize the transport."""
+        self._hub = hub
+        self._host = host
+        self.layout = layout
+        self._scan_interval = scan_interval
+        self._client = UnipiModbusClient(host, port, unit)
+        # Set to read again right away, e.g. to confirm a write
+        self._poll_now = asyncio.Event()
+
+    @callback
+    def can_write(self, device, circuit, value):
+        """Return True when the write is done through Modbus."""
+        return (
+            device in OUTPUT_DEVICES
+            and (device, circuit) in self.layout.coils
+            and value in ("0", "1")
+        )
+
+    async def async_write(self, changes):
+        """Write [((device, circuit), value)] as coils."""
+        coils = {self.layout.coils[key]: value == "1" for key, value in changes}
+        await asyncio.gather(
+            *(
+                self._client.async_write_coils(address, values)
+                for address, values in _runs(coils)
+            )
+        )
+        # The confirmation comes with the next read
+        self._poll_now.set()
+
+    async def async_run(self):
+        """Keep the Modbus connection up and poll the registers."""
+        delay = RECONNECT_MIN_DELAY
+        while True:
+            try:
+                await self._client.async_connect()
+                _LOGGER.info("Modbus connected to %s", self._host)
+                delay = RECONNECT_MIN_DELAY
+                await self._poll()
+            except (asyncio.TimeoutError, ConnectionError, OSError, ModbusError) as err:
+                _LOGGER.warning("Modbus connection to %s failed: %s", self._host, err)
+            finally:
+                await self._client.async_close()
+            await asyncio.sleep(delay)
+            delay = min(RECONNECT_MAX_DELAY, delay * 2)
+
+    async def async_stop(self):
+        await self._client.async_close()
+
+    async def _poll(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._poll_now.clear()
+            started = loop.time()
+            blocks = await asyncio.gather(
+                *(self._client.async_read_registers(address, count) for address, count in self.layout.spans)
+            )
+            registers = {}
+            for (address, _), values in zip(self.layout.spans, blocks):
+                for offset, value in enumerate(values):
+                    if address + offset in self.layout.bits:
+                        registers[address + offset] = value
+            self._hub.async_process_modbus(self.layout.decode(registers), started)
+            try:
+                await asyncio.wait_for(
+                    self._poll_now.wait(), started + self._scan_interval - loop.time()
+                )
+            except asyncio.TimeoutError:
+                pass
+
+
+def _spans(registers):
+    """Group sorted register addresses into (address, count) block reads."""
+    spans = []
+    for register in registers:
+        if spans and register - spans[-1][0] < MAX_READ_REGISTERS:
+            spans[-1][1] = register - spans[-1][0] + 1
+        else:
+            spans.append([register, 1])
+    return [tuple(span) for span in spans]
+
+
+def _runs(coils):
+    """Group {address: value} into (address, values) of consecutive coils."""
+    runs = []
+    for address in sorted(coils):
+        if (
+            runs
+            and address == runs[-1][0] + len(runs[-1][1])
+            and len(runs[-1][1]) < MAX_WRITE_COILS
+        ):
+            runs[-1][1].append(coils[address])
+        else:
+            runs.append((address, [coils[address]]))
+    return runs
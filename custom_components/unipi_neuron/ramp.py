@@ -0,0 +1,110 @@
+"""Brightness ramps of PWM dimmed Unipi lights."""
+from collections import Counter
+import logging
+
+from homeassistant.core import callback
+
+from .const import DOMAIN
+from .scheduler import async_get_scheduler
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_RAMP_ENGINE = f"{DOMAIN}_ramp_engine"
+
+# Shortest interval between two steps of a ramp in seconds
+RAMP_TICK = 0.1
+
+
+@callback
+def async_get_ramp_engine(hass):
+    """Return the ramp engine of the integration, creating it on first use."""
+    engine = hass.data.get(DATA_RAMP_ENGINE)
+    if engine is None:
+        engine = hass.data[DATA_RAMP_ENGINE] = UnipiRampEngine(hass)
+    return engine
+
+
+class _Ramp:
+    """Linear brightness ramp of one light."""
+
+    __slots__ = ("start_value", "target", "start_time", "duration", "last_value")
+
+    def __init__(self, start_value, target, start_time, duration):
+        self.start_value = start_value
+        self.target = target
+        self.start_time = start_time
+        self.duration = duration
+        self.last_value = start_value
+
+    def value_at(self, now):
+        progress = (now - self.start_time) / self.duration
+        return round(self.start_value + (self.target - self.start_value) * progress)
+
+
+class UnipiRampEngine:
+    """Step every running ramp of the integration on one shared tick.
+
+    The steps of all ramps on the same Neuron are issued in the same loop
+    iteration, so the command writer sends them as one burst. A Neuron
+    whose previous steps are still being written is skipped for a tick;
+    this adapts the step rate to what the websocket actually sustains.
+    """
+
+    def __init__(self, hass):
+        """Initialize the ramp engine."""
+        self._hass = hass
+        self._ramps = {}
+        # hub -> step writes not finished yet
+        self._busy = Counter()
+        self._tick = None
+
+    @callback
+    def async_start(self, light, start_value, target, duration):
+        """Ramp the brightness of light from start_value to target."""
+        self._ramps[light] = _Ramp(start_value, target, self._hass.loop.time(), duration)
+        if self._tick is None:
+            self._tick = async_get_scheduler(self._hass).async_schedule(0, self._async_step)
+
+    @callback
+    def async_cancel(self, light):
+        """Stop the ramp of light where it is.
+
+        Returns the last brightness written by the ramp, or None when the
+        light had no ramp running.
+        """
+        ramp = self._ramps.pop(light, None)
+        if ramp is None:
+            return None
+        return ramp.last_value
+
+    @callback
+    def _async_step(self):
+        """Write the next step of every ramp on a Neuron that keeps up."""
+        self._tick = None
+        now = self._hass.loop.time()
+        for light, ramp in list(self._ramps.items()):
+            hub = light._unipi_hub
+            finished = now >= ramp.start_time + ramp.duration
+            if not finished and self._busy[hub]:
+                continue
+            value = ramp.target if finished else ramp.value_at(now)
+            if finished:
+                del self._ramps[light]
+            if value == ramp.last_value and not finished:
+                continue
+            ramp.last_value = value
+            self._busy[hub] += 1
+            self._hass.async_create_task(self._async_write(hub, light, value))
+
+        if self._ramps:
+            self._tick = async_get_scheduler(self._hass).async_schedule(RAMP_TICK, self._async_step)
+
+    async def _async_write(self, hub, light, value):
+        try:
+            await light.async_write_brightness(value)
+        except Exception as err:  # pylint: disable=broad-except
+            _LOGGER.warning("Ramp step of %s failed: %s", light.name, err)
+        finally:
+            self._busy[hub] -= 1
+            if not self._busy[hub]:
+                del self._busy[hub]
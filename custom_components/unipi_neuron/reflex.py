@@ -0,0 +1,204 @@
+"""Input to output reflex rules evaluated in the EVOK receive path."""
+from functools import partial
+import logging
+
+import voluptuous as vol
+
+from homeassistant.const import CONF_DEVICE, CONF_NAME, CONF_PORT
+from homeassistant.core import callback
+import homeassistant.helpers.config_validation as cv
+
+from .const import CIRCUIT_REGEX
+from .metrics import Histogram
+from .scheduler import async_get_scheduler
+
+_LOGGER = logging.getLogger(__name__)
+
+CONF_REFLEXES = "reflexes"
+CONF_EDGE = "edge"
+CONF_ACTION = "action"
+CONF_DURATION = "duration"
+CONF_TARGET_DEVICE_ID = "target_device_id"
+CONF_TARGET_DEVICE = "target_device"
+CONF_TARGET_PORT = "target_port"
+
+EDGE_RISING = "rising"
+EDGE_FALLING = "falling"
+EDGE_BOTH = "both"
+
+ACTION_TOGGLE = "toggle"
+ACTION_FOLLOW = "follow"
+ACTION_TIMER = "timer"
+
+# Trigger to confirmed output, so the device round trip is included
+REFLEX_LATENCY_BUCKETS = (
+    0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1
+)
+
+
+def _validate_reflex(rule):
+    """Check the edge and duration fit the action."""
+    if rule[CONF_ACTION] == ACTION_FOLLOW:
+        # The output mirrors both edges of the input
+        if rule.setdefault(CONF_EDGE, EDGE_BOTH) != EDGE_BOTH:
+            raise vol.Invalid("follow rules react to both edges")
+    else:
+        rule.setdefault(CONF_EDGE, EDGE_RISING)
+    if (rule[CONF_ACTION] == ACTION_TIMER) != (CONF_DURATION in rule):
+        raise vol.Invalid("duration is required by, and only allowed for, timer rules")
+    return rule
+
+
+def _unique_names(rules):
+    names = [rule[CONF_NAME] for rule in rules]
+    if len(names) != len(set(names)):
+        raise vol.Invalid("reflex names must be unique per Neuron")
+    return rules
+
+
+REFLEX_SCHEMA = vol.All(
+    vol.Schema(
+        {
+            vol.Required(CONF_NAME): cv.string,
+            vol.Optional(CONF_DEVICE, default="input"): vol.Any("input", "di"),
+            vol.Required(CONF_PORT): cv.matches_regex(CIRCUIT_REGEX),
+            vol.Optional(CONF_EDGE): vol.In((EDGE_RISING, EDGE_FALLING, EDGE_BOTH)),
+            vol.Required(CONF_ACTION): vol.In((ACTION_TOGGLE, ACTION_FOLLOW, ACTION_TIMER)),
+            vol.Optional(CONF_DURATION): vol.All(cv.time_period, cv.positive_timedelta),
+            vol.Optional(CONF_TARGET_DEVICE_ID): cv.string,
+            vol.Optional(CONF_TARGET_DEVICE, default="relay"): vol.Any(
+                "relay", "led", "ro", "do"
+            ),
+            vol.Required(CONF_TARGET_PORT): cv.matches_regex(CIRCUIT_REGEX),
+        }
+    ),
+    _validate_reflex,
+)
+
+REFLEXES_SCHEMA = vol.All(cv.ensure_list, [REFLEX_SCHEMA], _unique_names)
+
+
+def validate_reflex_targets(neurons):
+    """Reject reflexes whose target Neuron is not configured."""
+    names = {neuron[CONF_NAME] for neuron in neurons}
+    for neuron in neurons:
+        for rule in neuron.get(CONF_REFLEXES, ()):
+            target = rule.setdefault(CONF_TARGET_DEVICE_ID, neuron[CONF_NAME])
+            if target not in names:
+                raise vol.Invalid(f"reflex {rule[CONF_NAME]} targets unknown Neuron {target}")
+    return neurons
+
+
+class UnipiReflexRule:
+    """One reflex: drive an output when an input edge is received."""
+
+    def __init__(self, hass, config, target_hub):
+        """Initialize the rule."""
+        self._hass = hass
+        self.name = config[CONF_NAME]
+        self._action = config[CONF_ACTION]
+        self._target_hub = target_hub
+        self._device = config[CONF_TARGET_DEVICE]
+        self._port = config[CONF_TARGET_PORT]
+        self._duration = None
+        if CONF_DURATION in config:
+            self._duration = config[CONF_DURATION].total_seconds()
+        self._cancel_timer = None
+        # Value of the last write and the number of its writes not yet resolved
+        self._commanded = None
+        self._pending = 0
+        self.latency = Histogram(REFLEX_LATENCY_BUCKETS)
+
+    @callback
+    def async_run(self, value, received_at):
+        """Act on the trigger value read at the loop.time() received_at."""
+        if self._action == ACTION_FOLLOW:
+            self._async_write("1" if value == 1 else "0", received_at)
+        elif self._action == ACTION_TOGGLE:
+            if self._pending:
+                # The cache does not show the write in flight yet
+                on = self._commanded == "1"
+            else:
+                on = self._target_hub.evok_state_get(self._device, self._port) == 1
+            self._async_write("0" if on else "1", received_at)
+        else:
+            # A new trigger restarts the timer
+            if self._cancel_timer is not None:
+                self._cancel_timer()
+            self._cancel_timer = async_get_scheduler(self._hass).async_schedule(
+                self._duration, self._async_timer_done
+            )
+            self._async_write("1", received_at)
+
+    @callback
+    def _async_timer_done(self):
+        self._cancel_timer = None
+        self._async_write("0", None)
+
+    @callback
+    def _async_write(self, value, received_at):
+        self._commanded = value
+        self._pending += 1
+        future = self._target_hub.async_queue_write(self._device, self._port, value)
+        future.add_done_callback(partial(self._write_done, received_at))
+
+    @callback
+    def _write_done(self, received_at, future):
+        self._pending -= 1
+        if future.cancelled():
+            return
+        if future.exception() is not None or not future.result():
+            _LOGGER.warning(
+                "Reflex %s could not set %s %s of %s",
+                self.name,
+                self._device,
+                self._port,
+                self._target_hub._name,
+            )
+            return
+        if received_at is not None:
+            self.latency.observe(self._hass.loop.time() - received_at)
+
+
+class UnipiReflexes:
+    """Reflex rules triggered by the inputs of one Neuron.
+
+    The rules are compiled into a (device, circuit) -> edge -> rules
+    table that the hub consults for every changed circuit, before the
+    entities are updated. Outputs are written straight into the command
+    queue of the target Neuron, which may be another one, without going
+    through the event bus, automations or service calls.
+    """
+
+    def __init__(self, hass, hub, rules, hubs):
+        """Compile rules of hub; hubs maps the Neuron names to their hubs."""
+        self._hub = hub
+        self.rules = []
+        self._triggers = {}
+        for config in rules:
+            rule = UnipiReflexRule(hass, config, hubs[config[CONF_TARGET_DEVICE_ID]])
+            self.rules.append(rule)
+            edges = self._triggers.setdefault(
+                (config[CONF_DEVICE], config[CONF_PORT]), {1: [], 0: []}
+            )
+            if config[CONF_EDGE] in (EDGE_RISING, EDGE_BOTH):
+                edges[1].append(rule)
+            if config[CONF_EDGE] in (EDGE_FALLING, EDGE_BOTH):
+                edges[0].append(rule)
+
+    @callback
+    def async_trigger(self, device, circuit, value):
+        """Run the rules of a circuit whose value changed."""
+        edges = self._triggers.get((device, circuit))
+        if edges is None:
+            return
+        if not self._hub.synced:
+            # Changes caught up by a (re)sync are not edges that just
+            # happened, e.g. a button pressed while disconnected
+            return
+        rules = edges.get(value)
+        if not rules:
+            return
+        received_at = self._hub.last_received_at
+        for rule in rules:
+            rule.async_run(value, received_at)
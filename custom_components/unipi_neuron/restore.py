@@ -0,0 +1,92 @@
+"""Write-behind store of the estimated entity state of the unipi_neuron integration."""
+import logging
+
+from homeassistant.const import EVENT_HOMEASSISTANT_FINAL_WRITE
+from homeassistant.core import callback
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_RESTORE = f"{DOMAIN}_restore"
+
+RESTORE_STORAGE_KEY = f"{DOMAIN}.restore"
+RESTORE_STORAGE_VERSION = 1
+# Changes within this many seconds are written together
+RESTORE_SAVE_DELAY = 10
+
+
+async def async_load_restore_store(hass):
+    """Load the stored entity state before the platforms are set up."""
+    store = hass.data[DATA_RESTORE] = UnipiRestoreStore(hass)
+    await store.async_load()
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_FINAL_WRITE, store.async_final_write)
+
+
+@callback
+def async_get_restore_store(hass):
+    """Return the restore store of the integration."""
+    return hass.data[DATA_RESTORE]
+
+
+class UnipiRestoreStore:
+    """Keep state the Neuron cannot report, e.g. cover positions.
+
+    Entities register a function returning their current state and call
+    async_schedule_save() when it changed. The state of all entities is
+    collected only when the file is written, at most every
+    RESTORE_SAVE_DELAY seconds and always once more when Home Assistant
+    stops, so e.g. a cover stopped mid-move keeps its estimate.
+    """
+
+    def __init__(self, hass):
+        """Initialize the store."""
+        self._store = Store(hass, RESTORE_STORAGE_VERSION, RESTORE_STORAGE_KEY)
+        # unique id -> stored state
+        self._data = {}
+        # unique id -> function returning the current state
+        self._entities = {}
+        self._save_pending = False
+
+    async def async_load(self):
+        self._data = await self._store.async_load() or {}
+
+    @callback
+    def async_restore(self, unique_id, dump):
+        """Return the stored state of unique_id and start tracking dump().
+
+        Returns the state (or None) and a function to stop tracking.
+        """
+
+        @callback
+        def remove():
+            if self._entities.get(unique_id) is dump:
+                self._data[unique_id] = dump()
+                del self._entities[unique_id]
+
+        self._entities[unique_id] = dump
+        return self._data.get(unique_id), remove
+
+    async def async_final_write(self, event):
+        """Write the current state of all entities before Home Assistant exits."""
+        if self._save_pending:
+            # The store writes a pending delayed save on final write itself
+            return
+        await self._store.async_save(self._async_data())
+
+    @callback
+    def async_schedule_save(self):
+        """Write the state of all entities soon."""
+        # Unlike a plain delayed save the first change is not postponed
+        # by later ones, so moving covers cannot starve the write
+        if not self._save_pending:
+            self._save_pending = True
+            self._store.async_delay_save(self._async_data, RESTORE_SAVE_DELAY)
+
+    @callback
+    def _async_data(self):
+        self._save_pending = False
+        for unique_id, dump in self._entities.items():
+            self._data[unique_id] = dump()
+        return {unique_id: state for unique_id, state in self._data.items() if state is not None}
@@ -0,0 +1,97 @@
+"""Shared deadline scheduler of the unipi_neuron integration."""
+import asyncio
+import heapq
+import itertools
+import logging
+
+from homeassistant.core import callback
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_SCHEDULER = f"{DOMAIN}_scheduler"
+
+# Loop timers may fire up to the clock resolution early
+TIMER_SLACK = 0.001
+
+
+@callback
+def async_get_scheduler(hass):
+    """Return the scheduler of the integration, creating it on first use."""
+    scheduler = hass.data.get(DATA_SCHEDULER)
+    if scheduler is None:
+        scheduler = hass.data[DATA_SCHEDULER] = UnipiScheduler(hass)
+    return scheduler
+
+
+class UnipiScheduler:
+    """Run actions at loop.time() deadlines from a single timer heap.
+
+    Only the earliest deadline has a loop timer armed, however many
+    deadlines are pending. Cancelled entries are dropped lazily when they
+    reach the top of the heap.
+    """
+
+    def __init__(self, hass):
+        """Initialize the scheduler."""
+        self._hass = hass
+        self._heap = []
+        self._sequence = itertools.count()
+        self._timer = None
+        self._timer_deadline = None
+
+    @callback
+    def async_schedule(self, delay, action):
+        """Run action after delay seconds; returns a cancel function."""
+        return self.async_schedule_at(self._hass.loop.time() + delay, action)
+
+    @callback
+    def async_schedule_at(self, deadline, action):
+        """Run action at the loop.time() deadline; returns a cancel function.
+
+        The action may be a callback, which is called right away, or a
+        coroutine function, which is started as a task.
+        """
+        entry = [deadline, next(self._sequence), action]
+        heapq.heappush(self._heap, entry)
+        if self._timer_deadline is None or deadline < self._timer_deadline:
+            self._arm()
+
+        @callback
+        def cancel():
+            entry[2] = None
+
+        return cancel
+
+    @callback
+    def _arm(self):
+        """Arm the loop timer for the earliest live deadline."""
+        heap = self._heap
+        while heap and heap[0][2] is None:
+            heapq.heappop(heap)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = self._timer_deadline = None
+        if heap:
+            self._timer_deadline = heap[0][0]
+            self._timer = self._hass.loop.call_at(self._timer_deadline, self._fire)
+
+    @callback
+    def _fire(self):
+        """Run every action that is due."""
+        self._timer = self._timer_deadline = None
+        heap = self._heap
+        now = self._hass.loop.time() + TIMER_SLACK
+        while heap and heap[0][0] <= now:
+            action = heapq.heappop(heap)[2]
+            if action is None:
+                continue
+            try:
+                if asyncio.iscoroutinefunction(action):
+                    self._hass.async_create_task(action(), f"{DOMAIN} {action.__qualname__}")
+                else:
+                    action()
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Error running scheduled action %s", action)
+        self._arm()
@@ -0,0 +1,647 @@
+"""Support for Unipi Neuron sensors."""
+from datetime import timedelta
+import logging
+import time
+
+import voluptuous as vol
+
+from homeassistant.components.sensor import (
+    DEVICE_CLASSES_SCHEMA,
+    PLATFORM_SCHEMA,
+    RestoreSensor,
+    SensorDeviceClass,
+    SensorEntity,
+    SensorStateClass,
+)
+from homeassistant.const import (
+    CONF_DEVICE,
+    CONF_DEVICE_CLASS,
+    CONF_DEVICE_ID,
+    CONF_DEVICES,
+    CONF_NAME,
+    CONF_PORT,
+    CONF_TYPE,
+    CONF_UNIT_OF_MEASUREMENT,
+    EntityCategory,
+    UnitOfTemperature,
+    UnitOfTime,
+)
+from homeassistant.core import callback
+import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.storage import Store
+
+from .const import CIRCUIT_REGEX, DOMAIN, ONEWIRE_ADDRESS_REGEX
+from .scheduler import async_get_scheduler
+
+_LOGGER = logging.getLogger(__name__)
+
+SCAN_INTERVAL = timedelta(seconds=10)
+
+CONF_INTERVAL = "interval"
+CONF_PULSES_PER_UNIT = "pulses_per_unit"
+CONF_DEADBAND = "deadband"
+CONF_DEADBAND_PERCENT = "deadband_percent"
+CONF_MIN_INTERVAL = "min_interval"
+CONF_MAX_INTERVAL = "max_interval"
+CONF_AVERAGE = "average"
+
+TYPE_COUNTER = "counter"
+TYPE_ANALOG = "analog"
+TYPE_TEMPERATURE = "temperature"
+
+DATA_ONEWIRE = f"{DOMAIN}_onewire"
+ONEWIRE_STORAGE_KEY = f"{DOMAIN}.onewire"
+ONEWIRE_STORAGE_VERSION = 1
+ONEWIRE_SAVE_DELAY = 10
+
+# EVOK digital input counters are 32 bit
+COUNTER_WRAP = 2**32
+
+COUNTER_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_NAME): cv.string,
+        vol.Required(CONF_TYPE): TYPE_COUNTER,
+        vol.Required(CONF_DEVICE): vol.Any("input", "di"),
+        vol.Required(CONF_PORT): cv.matches_regex(CIRCUIT_REGEX),
+        vol.Optional(CONF_PULSES_PER_UNIT, default=1): vol.All(
+            vol.Coerce(float), vol.Range(min=0, min_included=False)
+        ),
+        vol.Optional(CONF_UNIT_OF_MEASUREMENT): cv.string,
+        vol.Optional(CONF_DEVICE_CLASS): DEVICE_CLASSES_SCHEMA,
+        vol.Optional(CONF_INTERVAL, default=10): cv.time_period_seconds,
+    }
+)
+
+# Publishing of continuously changing values
+FILTER_SCHEMA = {
+    vol.Optional(CONF_DEADBAND): vol.All(vol.Coerce(float), vol.Range(min=0)),
+    vol.Optional(CONF_DEADBAND_PERCENT): vol.All(vol.Coerce(float), vol.Range(min=0)),
+    vol.Optional(CONF_MIN_INTERVAL, default=0): cv.time_period_seconds,
+    vol.Optional(CONF_MAX_INTERVAL): cv.time_period_seconds,
+    vol.Optional(CONF_AVERAGE, default=False): cv.boolean,
+}
+
+ANALOG_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_NAME): cv.string,
+        vol.Required(CONF_TYPE): TYPE_ANALOG,
+        vol.Required(CONF_DEVICE): vol.Any("ai"),
+        vol.Required(CONF_PORT): cv.matches_regex(CIRCUIT_REGEX),
+        vol.Optional(CONF_UNIT_OF_MEASUREMENT): cv.string,
+        vol.Optional(CONF_DEVICE_CLASS): DEVICE_CLASSES_SCHEMA,
+        **FILTER_SCHEMA,
+    }
+)
+
+# The port of a 1-Wire sensor is its address
+TEMPERATURE_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_NAME): cv.string,
+        vol.Required(CONF_TYPE): TYPE_TEMPERATURE,
+        vol.Optional(CONF_DEVICE, default="temp"): vol.Any("temp"),
+        vol.Required(CONF_PORT): cv.matches_regex(ONEWIRE_ADDRESS_REGEX),
+        **FILTER_SCHEMA,
+    }
+)
+
+DEVICE_SCHEMA = cv.key_value_schemas(
+    CONF_TYPE,
+    {
+        TYPE_COUNTER: COUNTER_SCHEMA,
+        TYPE_ANALOG: ANALOG_SCHEMA,
+        TYPE_TEMPERATURE: TEMPERATURE_SCHEMA,
+    },
+)
+
+PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
+    {
+        vol.Required(CONF_DEVICE_ID): cv.string,
+        vol.Required(CONF_DEVICES): vol.All(cv.ensure_list, [DEVICE_SCHEMA]),
+    }
+)
+
+# Quantile reported by the latency sensors
+LATENCY_QUANTILE = 0.95
+
+# key -> (name, unit, state class)
+METRIC_SENSORS = {
+    "messages_received": ("Messages received", "msg/s", SensorStateClass.MEASUREMENT),
+    "messages_sent": ("Messages sent", "msg/s", SensorStateClass.MEASUREMENT),
+    "dispatch_latency": ("Dispatch latency", UnitOfTime.MILLISECONDS, SensorStateClass.MEASUREMENT),
+    "command_rtt": ("Command round trip", UnitOfTime.MILLISECONDS, SensorStateClass.MEASUREMENT),
+    "queue_depth": ("Send queue depth", None, SensorStateClass.MEASUREMENT),
+    "reconnects": ("Reconnects", None, SensorStateClass.TOTAL_INCREASING),
+    "loop_lag": ("Event loop lag", UnitOfTime.MILLISECONDS, SensorStateClass.MEASUREMENT),
+    "direct_switch_drift": ("DirectSwitch drift", None, SensorStateClass.MEASUREMENT),
+    "reflex_latency": ("Reflex latency", UnitOfTime.MILLISECONDS, SensorStateClass.MEASUREMENT),
+}
+
+
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+    """Set up the Unipi sensors."""
+    sensors = []
+    if discovery_info is not None:
+        for unipi_device_name in discovery_info["devices"]:
+            unipi_hub = hass.data[DOMAIN][unipi_device_name]
+            for key in METRIC_SENSORS:
+                if key == "direct_switch_drift" and unipi_hub.direct_switch is None:
+                    continue
+                if key == "reflex_latency" and unipi_hub.reflexes is None:
+                    continue
+                sensors.append(UnipiMetricSensor(unipi_hub, key))
+        async_add_entities(sensors)
+        return
+
+    _LOGGER.info("Setup platform Unipi Neuron sensor on %s", config)
+    unipi_hub = hass.data[DOMAIN][config[CONF_DEVICE_ID]]
+    for sensor in config[CONF_DEVICES]:
+        if sensor[CONF_TYPE] == TYPE_COUNTER:
+            # No binary sensor is discovered for the pulses
+            unipi_hub.async_claim(sensor[CONF_DEVICE], sensor[CONF_PORT])
+            counter = UnipiPulseCounter(
+                unipi_hub,
+                sensor[CONF_DEVICE],
+                sensor[CONF_PORT],
+                sensor[CONF_INTERVAL],
+                sensor[CONF_PULSES_PER_UNIT],
+            )
+            unit = sensor.get(CONF_UNIT_OF_MEASUREMENT)
+            sensors.append(
+                UnipiCounterTotalSensor(
+                    counter, sensor[CONF_NAME], unit, sensor.get(CONF_DEVICE_CLASS)
+                )
+            )
+            sensors.append(UnipiCounterRateSensor(counter, f"{sensor[CONF_NAME]} rate", unit))
+        elif sensor[CONF_TYPE] == TYPE_ANALOG:
+            sensors.append(
+                UnipiAnalogSensor(
+                    unipi_hub,
+                    sensor,
+                    sensor.get(CONF_UNIT_OF_MEASUREMENT),
+                    sensor.get(CONF_DEVICE_CLASS),
+                )
+            )
+        else:
+            sensors.append(
+                UnipiAnalogSensor(
+                    unipi_hub,
+                    sensor,
+                    UnitOfTemperature.CELSIUS,
+                    SensorDeviceClass.TEMPERATURE,
+                )
+            )
+
+    # Also when Modbus serves the inputs, which reads their state but not
+    # their counters
+    unipi_hub.async_add_filter_devices(
+        {sensor.device for sensor in sensors if isinstance(sensor, UnipiAnalogSensor)}
+        | {
+            sensor[CONF_DEVICE]
+            for sensor in config[CONF_DEVICES]
+            if sensor[CONF_TYPE] == TYPE_COUNTER
+        }
+    )
+    async_add_entities(sensors)
+
+    addresses = [
+        sensor[CONF_PORT] for sensor in config[CONF_DEVICES] if sensor[CONF_TYPE] == TYPE_TEMPERATURE
+    ]
+    if addresses:
+        hass.async_create_background_task(
+            async_check_onewire_sensors(hass, unipi_hub, addresses),
+            f"{unipi_hub._name} 1-Wire check",
+        )
+
+
+async def async_get_onewire_store(hass):
+    """Return the store and the 1-Wire addresses seen per Neuron."""
+    data = hass.data.get(DATA_ONEWIRE)
+    if data is None:
+        store = Store(hass, ONEWIRE_STORAGE_VERSION, ONEWIRE_STORAGE_KEY)
+        data = hass.data[DATA_ONEWIRE] = (store, await store.async_load() or {})
+    return data
+
+
+async def async_check_onewire_sensors(hass, unipi_hub, addresses):
+    """Scan the 1-Wire bus only for sensors that were never seen.
+
+    Sensors seen once are remembered, so a restart does not need a bus
+    scan; a known sensor that is missing is more likely lost than new.
+    """
+    store, known = await async_get_onewire_store(hass)
+    await unipi_hub.ready.wait()
+    seen = known.setdefault(unipi_hub._name, [])
+    missing = []
+    for address in addresses:
+        if unipi_hub.evok_state_get("temp", address, None) is not None:
+            if address not in seen:
+                seen.append(address)
+                store.async_delay_save(lambda: known, ONEWIRE_SAVE_DELAY)
+        elif address in seen:
+            _LOGGER.warning("1-Wire sensor %s on %s is not reporting", address, unipi_hub._name)
+        else:
+            missing.append(address)
+
+    if missing:
+        _LOGGER.info("1-Wire sensors %s on %s never seen", missing, unipi_hub._name)
+        try:
+            await unipi_hub.evok_onewire_scan()
+        except Exception as err:  # pylint: disable=broad-except
+            _LOGGER.warning("1-Wire scan on %s failed: %s", unipi_hub._name, err)
+
+
+class UnipiMetricSensor(SensorEntity):
+    """Diagnostic sensor exposing a performance metric of a Neuron connection."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, unipi_hub, key):
+        """Initialize the metric sensor."""
+        self._unipi_hub = unipi_hub
+        self._key = key
+        name, unit, state_class = METRIC_SENSORS[key]
+        self._attr_name = f"{unipi_hub._name} {name}"
+        self._attr_unique_id = f"{key}_at_{unipi_hub._name}"
+        self._attr_native_unit_of_measurement = unit
+        self._attr_state_class = state_class
+        self._last_update = time.monotonic()
+        self._last_value = self._read_counter()
+
+    def _read_counter(self):
+        """Return the counter or histogram snapshot the state is derived from."""
+        metrics = self._unipi_hub.metrics
+        if self._key == "messages_received":
+            return metrics.messages_received
+        if self._key == "messages_sent":
+            return metrics.messages_sent
+        if self._key == "dispatch_latency":
+            return metrics.dispatch_latency.snapshot()
+        if self._key == "command_rtt":
+            return metrics.command_rtt.snapshot()
+        if self._key == "reflex_latency":
+            return {rule.name: rule.latency.snapshot() for rule in self._unipi_hub.reflexes.rules}
+        return None
+
+    async def async_update(self):
+        """Derive the state from the counters since the last update."""
+        metrics = self._unipi_hub.metrics
+        now = time.monotonic()
+        elapsed = now - self._last_update
+        value = self._read_counter()
+
+        if self._key in ("messages_received", "messages_sent"):
+            self._attr_native_value = round((value - self._last_value) / elapsed, 2)
+        elif self._key in ("dispatch_latency", "command_rtt"):
+            histogram = getattr(metrics, self._key)
+            quantile = histogram.quantile(LATENCY_QUANTILE, since=self._last_value)
+            self._attr_native_value = None if quantile is None else quantile * 1000
+        elif self._key == "queue_depth":
+            self._attr_native_value = self._unipi_hub.queue_depth
+            self._attr_extra_state_attributes = {
+                "pending_confirmations": self._unipi_hub.pending_confirmations
+            }
+        elif self._key == "reconnects":
+            self._attr_native_value = self._unipi_hub.reconnect_count
+            self._attr_extra_state_attributes = {
+                "last_resync_time": self._unipi_hub.last_resync_time,
+                "last_resync_changes": self._unipi_hub.last_resync_changes,
+            }
+        elif self._key == "loop_lag":
+            self._attr_native_value = round(metrics.loop_lag_max * 1000, 1)
+            metrics.loop_lag_max = metrics.loop_lag
+        elif self._key == "direct_switch_drift":
+            drift = self._unipi_hub.direct_switch.drift
+            self._attr_native_value = len(drift)
+            self._attr_extra_state_attributes = {"inputs": drift}
+        elif self._key == "reflex_latency":
+            # The slowest rule is the state, every rule an attribute
+            latencies = {}
+            for rule in self._unipi_hub.reflexes.rules:
+                quantile = rule.latency.quantile(LATENCY_QUANTILE, since=self._last_value[rule.name])
+                latencies[rule.name] = None if quantile is None else quantile * 1000
+            measured = [latency for latency in latencies.values() if latency is not None]
+            self._attr_native_value = max(measured) if measured else None
+            self._attr_extra_state_attributes = latencies
+
+        self._last_update = now
+        self._last_value = value
+
+
+class UnipiPulseCounter:
+    """Turn the hardware pulse counter of a digital input into a total and a rate.
+
+    The counter is sampled from the hub cache once per interval, so the
+    load on Home Assistant does not depend on the pulse frequency.
+    """
+
+    def __init__(self, unipi_hub, device, port, interval, pulses_per_unit):
+        """Initialize the pulse counter."""
+        self.unipi_hub = unipi_hub
+        self.device = device
+        self.port = port
+        self._interval = interval.total_seconds()
+        self._pulses_per_unit = pulses_per_unit
+        # Pulses counted since the total was started
+        self.pulses = 0.0
+        # Units per hour over the last interval
+        self.rate = None
+        # Last raw value of the hardware counter
+        self.counter = None
+        self._sampled_at = None
+        self._entities = []
+        self._timer = None
+
+    @property
+    def total(self):
+        """Return the total in units."""
+        return round(self.pulses / self._pulses_per_unit, 6)
+
+    @callback
+    def async_add_entity(self, entity):
+        """Write the state of entity whenever a sample changed the values."""
+        self._entities.append(entity)
+
+        @callback
+        def remove():
+            self._entities.remove(entity)
+
+        return remove
+
+    @callback
+    def async_start(self, hass):
+        """Start sampling; returns a function that stops it again."""
+        scheduler = async_get_scheduler(hass)
+        deadline = hass.loop.time() + self._interval
+
+        @callback
+        def sample():
+            nonlocal deadline
+            self._async_sample(hass.loop.time())
+            deadline += self._interval
+            self._timer = scheduler.async_schedule_at(deadline, sample)
+
+        self._timer = scheduler.async_schedule_at(deadline, sample)
+        # A counter already in the cache is the baseline of the first rate
+        self._async_sample(hass.loop.time())
+
+        @callback
+        def stop():
+            if self._timer is not None:
+                self._timer()
+                self._timer = None
+
+        return stop
+
+    @callback
+    def _async_sample(self, now):
+        if not self.unipi_hub.synced:
+            # Counters in the cache may be stale until the device resynced
+            return
+        counter = self.unipi_hub.evok_counter_get(self.device, self.port)
+        if counter is None:
+            return
+
+        changed = False
+        if self.counter is not None:
+            delta = counter - self.counter
+            if delta < 0:
+                if self.counter >= COUNTER_WRAP // 2 > counter:
+                    delta += COUNTER_WRAP
+                else:
+                    # Counter was reset, e.g. by a restart of the Neuron
+                    _LOGGER.info(
+                        "Counter %s %s on %s was reset", self.device, self.port, self.unipi_hub._name
+                    )
+                    delta = counter
+            self.pulses += delta
+            if self._sampled_at is not None:
+                rate = round(
+                    delta / self._pulses_per_unit / (now - self._sampled_at) * 3600, 6
+                )
+                changed = rate != self.rate
+                self.rate = rate
+            changed |= delta != 0
+        self.counter = counter
+        self._sampled_at = now
+
+        if changed:
+            for entity in self._entities:
+                self.unipi_hub.async_schedule_write(entity)
+
+
+class UnipiCounterTotalSensor(RestoreSensor):
+    """Total of the pulses counted on a digital input."""
+
+    _attr_should_poll = False
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+
+    def __init__(self, counter, name, unit, device_class):
+        """Initialize the total sensor."""
+        self._counter = counter
+        self._attr_name = name
+        self._attr_unique_id = (
+            f"{counter.device}_{counter.port}_counter_at_{counter.unipi_hub._name}"
+        )
+        self._attr_native_unit_of_measurement = unit
+        self._attr_device_class = device_class
+
+    async def async_added_to_hass(self):
+        """Restore the total and start sampling the counter."""
+        last_data = await self.async_get_last_sensor_data()
+        if last_data is not None and last_data.native_value is not None:
+            self._counter.pulses = float(last_data.native_value) * self._counter._pulses_per_unit
+            last_state = await self.async_get_last_state()
+            if last_state is not None:
+                # Pulses counted while Home Assistant was down are added
+                # on the first sample
+                self._counter.counter = last_state.attributes.get("counter")
+        self.async_on_remove(self._counter.async_add_entity(self))
+        self.async_on_remove(self._counter.unipi_hub.async_add_entity(self))
+        self.async_on_remove(self._counter.async_start(self.hass))
+
+    @property
+    def native_value(self):
+        """Return the total in units."""
+        return self._counter.total
+
+    @property
+    def extra_state_attributes(self):
+        """Return the raw hardware counter."""
+        return {"counter": self._counter.counter}
+
+    @property
+    def available(self):
+        """Return True while the Neuron is connected."""
+        return self._counter.unipi_hub.available
+
+
+class UnipiCounterRateSensor(SensorEntity):
+    """Rate of the pulses counted on a digital input, in units per hour."""
+
+    _attr_should_poll = False
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(self, counter, name, unit):
+        """Initialize the rate sensor."""
+        self._counter = counter
+        self._attr_name = name
+        self._attr_unique_id = (
+            f"{counter.device}_{counter.port}_counter_rate_at_{counter.unipi_hub._name}"
+        )
+        self._attr_native_unit_of_measurement = f"{unit}/h" if unit else "pulses/h"
+
+    async def async_added_to_hass(self):
+        """Register for new samples of the counter."""
+        self.async_on_remove(self._counter.async_add_entity(self))
+        self.async_on_remove(self._counter.unipi_hub.async_add_entity(self))
+
+    @property
+    def native_value(self):
+        """Return the rate in units per hour."""
+        return self._counter.rate
+
+    @property
+    def available(self):
+        """Return True while the Neuron is connected."""
+        return self._counter.unipi_hub.available
+
+
+class UnipiAnalogSensor(SensorEntity):
+    """Analog input or 1-Wire temperature sensor on a Unipi device.
+
+    A new value is published when it moved out of the deadband, but not
+    more often than min_interval. A value that changed at all is published
+    at least every max_interval. With average, the mean of the values
+    received since the last publish is published.
+    """
+
+    _attr_should_poll = False
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(self, unipi_hub, config, unit, device_class):
+        """Initialize the sensor."""
+        self._unipi_hub = unipi_hub
+        self.device = config[CONF_DEVICE]
+        self._port = config[CONF_PORT]
+        self._attr_name = config[CONF_NAME]
+        self._attr_unique_id = f"{self.device}_{self._port}_at_{unipi_hub._name}"
+        self._attr_native_unit_of_measurement = unit
+        self._attr_device_class = device_class
+        self._deadband = config.get(CONF_DEADBAND)
+        self._deadband_percent = config.get(CONF_DEADBAND_PERCENT)
+        self._min_interval = config[CONF_MIN_INTERVAL].total_seconds()
+        max_interval = config.get(CONF_MAX_INTERVAL)
+        self._max_interval = max_interval.total_seconds() if max_interval else None
+        self._average = config[CONF_AVERAGE]
+        self._latest = None
+        self._sum = 0.0
+        self._count = 0
+        self._published_at = None
+        self._scheduler = None
+        self._timer = None
+        self._timer_deadline = None
+
+    async def async_added_to_hass(self):
+        """Register for updates of the input."""
+        self._scheduler = async_get_scheduler(self.hass)
+        self.async_on_remove(
+            self._unipi_hub.async_add_listener(self.device, self._port, self._update_callback)
+        )
+        self.async_on_remove(self._unipi_hub.async_add_entity(self))
+        self.async_on_remove(self._cancel_timer)
+        # Start from the cached value if the device already reported it
+        value = self._unipi_hub.evok_state_get(self.device, self._port, None)
+        if value is not None:
+            self._add_sample(value)
+            if self._candidate() is not None:
+                self._publish(self.hass.loop.time(), write=False)
+
+    @property
+    def available(self):
+        """Return True while the Neuron is connected."""
+        return self._unipi_hub.available
+
+    @callback
+    def _update_callback(self, value):
+        """The input has a new value."""
+        self._add_sample(value)
+        now = self.hass.loop.time()
+        if not self._outside_deadband():
+            return
+        if self._published_at is None or now - self._published_at >= self._min_interval:
+            self._publish(now)
+        else:
+            self._schedule(self._published_at + self._min_interval)
+
+    def _add_sample(self, value):
+        if not isinstance(value, (int, float)):
+            # e.g. a 1-Wire sensor that was lost
+            return
+        self._latest = value
+        self._sum += value
+        self._count += 1
+
+    def _candidate(self):
+        """Return the value that would be published now."""
+        if self._average and self._count:
+            return self._sum / self._count
+        return self._latest
+
+    def _outside_deadband(self):
+        published = self._attr_native_value
+        candidate = self._candidate()
+        if published is None:
+            return candidate is not None
+        change = abs(candidate - published)
+        if self._deadband is not None and change < self._deadband:
+            return False
+        if self._deadband_percent is not None and change < abs(published) * self._deadband_percent / 100:
+            return False
+        return change > 0
+
+    @callback
+    def _publish(self, now, write=True):
+        self._attr_native_value = round(self._candidate(), 3)
+        self._sum = 0.0
+        self._count = 0
+        self._published_at = now
+        self._cancel_timer()
+        if self._max_interval:
+            self._schedule(now + self._max_interval)
+        if write:
+            self._unipi_hub.async_schedule_write(self)
+
+    @callback
+    def _timer_expired(self):
+        self._timer = self._timer_deadline = None
+        now = self.hass.loop.time()
+        if not self._count:
+            # Nothing new since the last publish
+            if self._max_interval:
+                self._schedule(now + self._max_interval)
+            return
+        heartbeat = (
+            self._max_interval is not None
+            and now - self._published_at >= self._max_interval - 0.001
+            and round(self._candidate(), 3) != self._attr_native_value
+        )
+        if heartbeat or self._outside_deadband():
+            self._publish(now)
+        elif self._max_interval:
+            self._schedule(self._published_at + self._max_interval)
+
+    @callback
+    def _schedule(self, deadline):
+        """Evaluate the input at deadline, unless that happens earlier anyway."""
+        if self._timer is not None:
+            if self._timer_deadline <= deadline:
+                return
+            self._timer()
+        self._timer_deadline = deadline
+        self._timer = self._scheduler.async_schedule_at(deadline, self._timer_expired)
+
+    @callback
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer()
+            self._timer = self._timer_deadline = None
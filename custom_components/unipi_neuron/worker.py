@@ -0,0 +1,293 @@
+"""I/O worker thread for the EVOK websocket connections."""
+import asyncio
+from collections import deque
+import logging
+import threading
+
+from homeassistant.core import callback
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_IO_WORKER = f"{DOMAIN}_io_worker"
+
+
+@callback
+def async_get_io_worker(hass):
+    """Return the I/O worker of the integration, starting it on first use."""
+    worker = hass.data.get(DATA_IO_WORKER)
+    if worker is None:
+        worker = hass.data[DATA_IO_WORKER] = UnipiIoWorker(hass)
+    return worker
+
+
+class UnipiIoWorker:
+    """Run the websocket I/O of all Neurons on one thread with its own event loop.
+
+    Only compact circuit changes cross over to the Home Assistant loop,
+    so receiving and decoding a flood of messages does not compete with
+    the rest of Home Assistant.
+    """
+
+    def __init__(self, hass):
+        """Start the worker thread."""
+        self._hass = hass
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run, name=f"{DOMAIN}_io", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        # Cancel what is still running, e.g. a ping, before closing the loop
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+    async def async_run(self, coro):
+        """Run coro on the worker loop and return its result."""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    async def async_stop(self):
+        """Stop the worker loop and wait for the thread to end."""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        await self._hass.async_add_executor_job(self._thread.join)
+
+
+class UnipiEvokReader:
+    """Event connection of one Neuron, served by the I/O worker.
+
+    The worker receives and decodes the messages and drops the circuits
+    whose value did not change. The changes of a message are queued as a
+    batch of [(device, circuit, value, counter, direct_switch)], with the
+    Home Assistant loop.time() it was received at and the number of
+    messages since the previous batch.
+    The Home Assistant loop is woken once for everything queued in the
+    meantime. Full state sync replies are passed on whole, so the hub can
+    compare them with its own state. Outgoing frames are queued the other
+    way round and written in order by the worker.
+    """
+
+    def __init__(self, worker, hub, ip_address, neuron_type):
+        """Initialize the reader."""
+        self._worker = worker
+        self._hub = hub
+        self._hass = hub._hass
+        self._ip_address = ip_address
+        self._neuron_type = neuron_type
+        # Used on the worker loop only
+        self._client = None
+        self._receive_task = None
+        self._send_task = None
+        self._ping_task = None
+        # (device, circuit) -> last change received
+        self._values = {}
+        # Handed over between the threads
+        self._batches = deque()
+        self._frames = deque()
+        self._wakeup_pending = False
+        self._send_pending = False
+        # Future of the HA loop waiting for batches
+        self._waiter = None
+        self.connected = False
+
+    async def async_connect(self):
+        """Connect to EVOK and start receiving."""
+        return await self._worker.async_run(self._connect())
+
+    async def async_close(self):
+        """Close the connection."""
+        self.connected = False
+        await self._worker.async_run(self._close())
+
+    async def async_ping(self):
+        """Send a websocket ping and wait for the pong."""
+        # The ping coroutine is created on the worker loop, so a ping given
+        # up on here is cancelled there instead of being left unawaited
+        future = self._hass.loop.create_future()
+        self._worker.loop.call_soon_threadsafe(self._start_ping, future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            self._worker.loop.call_soon_threadsafe(self._cancel_ping)
+            raise
+
+    @callback
+    def abort(self):
+        """Drop the connection without a close handshake."""
+        self.connected = False
+        self._worker.loop.call_soon_threadsafe(self._abort)
+
+    @callback
+    def send(self, frame):
+        """Queue frame to be written by the worker."""
+        if not self.connected:
+            raise ConnectionError("not connected")
+        self._frames.append(frame)
+        if not self._send_pending:
+            self._send_pending = True
+            self._worker.loop.call_soon_threadsafe(self._start_send)
+
+    async def async_receive(self):
+        """Return the batches received since the last call.
+
+        Waits for at least one; a batch of None means the connection was lost.
+        """
+        if not self._batches:
+            self._waiter = self._hass.loop.create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        batches = []
+        while self._batches:
+            batches.append(self._batches.popleft())
+        return batches
+
+    @callback
+    def _ping_resolved(self, future, err):
+        if future.done():
+            return
+        if err is None:
+            future.set_result(None)
+        else:
+            future.set_exception(err)
+
+    @callback
+    def _wakeup(self):
+        self._wakeup_pending = False
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    # Everything below runs on the worker loop
+
+    async def _connect(self):
+        if self._client is None:
+            from evok_ws_client import UnipiEvokWsClient
+
+            self._client = UnipiEvokWsClient(
+                self._ip_address, self._neuron_type, self._hub._name
+            )
+        if not await self._client.evok_connect():
+            return False
+        self._batches.clear()
+        self.connected = True
+        self._receive_task = self._worker.loop.create_task(self._receive())
+        return True
+
+    async def _close(self):
+        self._cancel_ping()
+        if self._receive_task is not None:
+            self._receive_task.cancel()
+            self._receive_task = None
+        self._frames.clear()
+        if self._client is None or self._client._ws is None:
+            return
+        ws, self._client._ws = self._client._ws, None
+        try:
+            await ws.close()
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.warning("Unable to close connection to %s", self._hub._name)
+
+    def _start_ping(self, future):
+        self._cancel_ping()
+        self._ping_task = self._worker.loop.create_task(self._ping())
+        self._ping_task.add_done_callback(lambda task: self._ping_done(future, task))
+
+    def _ping_done(self, future, task):
+        if task is self._ping_task:
+            self._ping_task = None
+        if task.cancelled():
+            err = ConnectionError("ping cancelled")
+        else:
+            err = task.exception()
+        self._hass.loop.call_soon_threadsafe(self._ping_resolved, future, err)
+
+    def _cancel_ping(self):
+        if self._ping_task is not None:
+            self._ping_task.cancel()
+            self._ping_task = None
+
+    async def _ping(self):
+        pong_waiter = await self._client._ws.ping()
+        await pong_waiter
+
+    def _abort(self):
+        self._cancel_ping()
+        if self._client is not None and self._client._ws is not None:
+            self._client._ws.transport.abort()
+
+    def _start_send(self):
+        if self._send_task is None or self._send_task.done():
+            self._send_task = self._worker.loop.create_task(self._send())
+
+    async def _send(self):
+        while self._frames:
+            self._send_pending = False
+            frame = self._frames.popleft()
+            ws = self._client._ws if self._client is not None else None
+            if ws is None:
+                continue
+            try:
+                await ws.send(frame)
+            except Exception as err:  # pylint: disable=broad-except
+                # The receive side notices the lost connection
+                _LOGGER.debug("Sending to %s failed: %s", self._hub._name, err)
+
+    async def _receive(self):
+        # The hub compares the receive times with its own loop.time(). It
+        # only reads time.monotonic(), so it is safe to call from here.
+        clock = self._hass.loop.time
+        values = self._values
+        # Messages received since the last batch, for the metrics
+        messages = 0
+        while True:
+            try:
+                message = await self._client.evok_receive(False)
+            except Exception as err:  # pylint: disable=broad-except
+                _LOGGER.warning("Receiving from %s failed: %s", self._hub._name, err)
+                message = False
+            if message is False:
+                self.connected = False
+                self._post(None)
+                return
+            received_at = clock()
+            messages += 1
+            if isinstance(message, dict):
+                message = [message]
+            # Only the reply to a full state sync carries devices outside
+            # of the registered filter
+            filter_devices = self._hub._filter_devices
+            snapshot = any(
+                section["dev"] not in filter_devices
+                for section in message
+                if isinstance(section, dict) and "dev" in section
+            )
+            changes = []
+            for section in message:
+                try:
+                    key = (section["dev"], section["circuit"])
+                    value = section["value"]
+                except (KeyError, TypeError):
+                    continue
+                direct_switch = None
+                if "ds_mode" in section:
+                    direct_switch = (section.get("mode"), section["ds_mode"])
+                change = (*key, value, section.get("counter"), direct_switch)
+                if snapshot or values.get(key) != change:
+                    values[key] = change
+                    changes.append(change)
+            if changes or snapshot:
+                self._post((changes, snapshot, received_at, messages))
+                messages = 0
+
+    def _post(self, batch):
+        self._batches.append(batch)
+        if not self._wakeup_pending:
+            self._wakeup_pending = True
+            self._hass.loop.call_soon_threadsafe(self._wakeup)